@@ -1,208 +1,569 @@
-import requests
+import argparse
+import asyncio
+import io
 import spacy
 from spacytextblob.spacytextblob import SpacyTextBlob
 from bs4 import BeautifulSoup
 from tqdm.auto import tqdm
 import json
 import os
+import queue
 import re as regex
+import threading
+import time
+import numpy as np
 from collections import Counter, OrderedDict
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-from util.constants import PARENT_DIR
-
-def add_show(show, show_name):
-    ### SETUP
-    SHOW_DIR = f'{PARENT_DIR}/{show}'
-    if os.path.isdir(SHOW_DIR):
-        raise Exception(f'Attempted to import show {show_name} but it already exists! To reimport, delete the show directory ({SHOW_DIR}) and try again.')
-    Path(SHOW_DIR).mkdir(exist_ok=True)
-    Path(f'{SHOW_DIR}/meta').mkdir(exist_ok=True)
-    Path(f'{SHOW_DIR}/raw').mkdir(exist_ok=True)
-
-    print(f'Importing {show_name}...')
-
-    ### Get a list of all pages for the show
-
-    topicRegex = regex.compile(r"t=(\d+)")
-
-    url = 'https://transcripts.foreverdreaming.org/viewforum.php?f=' + str(show)
-    response = requests.get(url)
-
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    title = soup.find('h2', class_='forum-title').text
-    with open(f'{SHOW_DIR}/meta/title.txt', 'w', encoding='utf-8') as file:
-        file.write(title)
-
-    pageCount = 1
-    for a in soup.find('div', class_='pagination').find_all('a'):
-        if a.text.isdigit() and int(a.text) > pageCount:
-            pageCount = int(a.text)
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from util.archive import is_packed, list_folder, pack_show, read_text
+from util.arcs import save_arcs, load_arc_episodes
+from util.constants import PARENT_DIR, ANALYSIS_WORKERS, ANALYSIS_BATCH_SIZE, PIPELINE_QUEUE_SIZE, PACK_SHOWS
+from util.counts import save_count_matrix, load_matrix_frequencies, load_matrix_totals
+from util.scraper import Scraper
+from util.search import build_search_index
+from util.uncensor import load_uncensor
+from util.manifest import update_manifest
+from util.metrics import metrics, span
+from util.version import write_data_version
+
+### Analysis workers (run in separate processes, so everything here is module level)
+
+nlp = None
+
+def load_nlp():
+    global nlp
+    nlp = spacy.load('en_core_web_sm', exclude=['parser', 'ner'])
+    # Without the parser, the small statistical sentence splitter provides doc.sents
+    nlp.enable_pipe('senter')
+    nlp.add_pipe('spacytextblob')
 
+def get_text_from_episode(show_dir, season, episode):
+    lines = io.StringIO(read_text(show_dir, f'formatted/{season}/{episode}')).readlines()
+    return '\n'.join(lines[1:])
+
+def save_frequency_to_file(show_dir, path, analysis):
+    save_path = Path(f'{show_dir}/analysis/word_frequency/{path}')
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(save_path, 'w', encoding='utf-8') as f:
+        for word, freq in Counter(analysis).most_common():
+            f.write(f'{word}: {freq}\n')
+
+def save_order_to_file(show_dir, path, analysis):
+    save_path = Path(f'{show_dir}/analysis/word_order/{path}')
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(save_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(analysis))
+
+def save_sentiment_to_file(show_dir, analysis):
+    save_path = Path(f'{show_dir}/analysis/sentiment.txt')
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(save_path, 'w', encoding='utf-8') as f:
+        for episode, sentiment in analysis.items():
+            f.write(f'{episode}: {sentiment}\n')
+
+def remove_duplicates(analysis):
+    return list(OrderedDict.fromkeys(analysis))
+
+def merge_orders(orders):
+    # dict keeps first-insertion order, so this is a linear-time ordered union
+    merged = {}
+    for order in orders:
+        merged.update(dict.fromkeys(order))
+    return list(merged)
+
+def natural_key(name):
+    name = name.split('.txt')[0]
+    return (0, int(name), name) if name.isdigit() else (1, 0, name)
+
+def episode_key(key):
+    season, episode = key
+    return natural_key(season), natural_key(episode)
+
+def analyze_episodes(show_dir, episodes, timings=None):
+    # timings, when given, collects seconds spent in spaCy and in writing the episode files
+    timings = {} if timings is None else timings
+    texts = (get_text_from_episode(show_dir, season, episode) for season, episode in episodes)
+    results = []
+    docs = iter(nlp.pipe(texts, batch_size=len(episodes)))
+    for season, episode in episodes:
+        start = time.perf_counter()
+        doc = next(docs)
+        tokens = [token for token in doc if token.is_alpha and not token.is_stop]
+        # Every word counts towards the episode's length, stop words included
+        word_count = sum(1 for token in doc if token.is_alpha)
+        words = [f'{token.lemma_.lower()}_{token.pos_}' for token in tokens]
+        word_freq = Counter(words)
+        word_order = remove_duplicates(words)
+        polarity = doc._.blob.polarity
+        subjectivity = doc._.blob.subjectivity
+        sentence_polarity = np.array([sentence._.blob.polarity for sentence in doc.sents], dtype=np.float32)
+        written = time.perf_counter()
+        save_frequency_to_file(show_dir, f'episode/{season}/{episode}', words)
+        save_order_to_file(show_dir, f'episode/{season}/{episode}', word_order)
+        timings['spacy'] = timings.get('spacy', 0) + written - start
+        timings['write_episode'] = timings.get('write_episode', 0) + time.perf_counter() - written
+        results.append((season, episode, word_freq, word_order, polarity, subjectivity, sentence_polarity, word_count))
+    return results
+
+def load_counter(show_dir, path):
+    # Rebuild a Counter in first-occurrence order (the order the analysis originally produced it in)
+    frequency = {}
+    for line in read_text(show_dir, f'analysis/word_frequency/{path}').splitlines():
+        word, freq = line.split(': ')
+        frequency[word] = int(freq)
+    content = read_text(show_dir, f'analysis/word_order/{path}')
+    order = content.split('\n') if content else []
+    return Counter({word: frequency[word] for word in order}), order
+
+def load_sentiment(show_dir):
+    sentiment = {}
+    path = f'{show_dir}/analysis/sentiment.txt'
+    if not os.path.isfile(path):
+        return sentiment
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            code, value = line.rstrip('\n').rsplit(': ', 1)
+            season, episode = code.split('x', 1)
+            sentiment[(season, episode)] = value
+    return sentiment
+
+def save_season_aggregates(show_dir, season, analyses):
+    season_frequency = Counter()
+    episodes = sorted(analyses, key=natural_key)
+    for episode in episodes:
+        season_frequency.update(analyses[episode][0])
+    season_order = merge_orders(analyses[episode][1] for episode in episodes)
+    save_frequency_to_file(show_dir, f'season/{season}.txt', season_frequency)
+    save_order_to_file(show_dir, f'season/{season}.txt', season_order)
+    return season_frequency, season_order
+
+def save_show_aggregates(show_dir, seasons, sentiment, episode_frequency, episode_words):
+    # Seasons and episodes are merged in natural order, so the output does not depend on which worker finished first
+    show_frequency = Counter()
+    season_orders = []
+    for season in sorted(seasons, key=natural_key):
+        show_frequency.update(seasons[season][0])
+        season_orders.append(seasons[season][1])
+    save_frequency_to_file(show_dir, 'show.txt', show_frequency)
+    save_order_to_file(show_dir, 'show.txt', merge_orders(season_orders))
+    ordered = sorted(sentiment, key=episode_key)
+    save_sentiment_to_file(show_dir, {f'{season}x{episode}': sentiment[(season, episode)] for season, episode in ordered})
+    save_count_matrix(show_dir, episode_frequency, episode_words)
+
+def format_sentiment(polarity, subjectivity):
+    return f'{round(polarity, 3)} {round(subjectivity, 3)}'
+
+def save_aggregates(show_dir, results):
+    seasons = {season: save_season_aggregates(show_dir, season, analyses) for season, analyses in results.items()}
+    sentiment = {(season, episode): format_sentiment(*analysis[2:4]) for season, analyses in results.items() for episode, analysis in analyses.items()}
+    episode_frequency = {season: {episode: analysis[0] for episode, analysis in analyses.items()} for season, analyses in results.items()}
+    episode_words = {season: {episode: analysis[5] for episode, analysis in analyses.items()} for season, analyses in results.items()}
+    save_show_aggregates(show_dir, seasons, sentiment, episode_frequency, episode_words)
+    save_arcs(show_dir, {(season, episode): analysis[4] for season, analyses in results.items() for episode, analysis in analyses.items()}, key=episode_key)
+
+def patch_aggregates(show_dir, show_map, results):
+    # Only seasons with new or changed episodes are re-merged, from the stored per-episode files; the rest reuse their season files
+    episode_frequency = load_matrix_frequencies(show_dir)
+    episode_words = load_matrix_totals(show_dir)
+    sentiment = load_sentiment(show_dir)
+    arcs = load_arc_episodes(show_dir)
+    seasons = {}
+    for season in show_map:
+        if season not in results:
+            seasons[season] = load_counter(show_dir, f'season/{season}.txt')
+            if season not in episode_frequency:
+                episode_frequency[season] = {episode: load_counter(show_dir, f'episode/{season}/{episode}')[0] for episode in show_map[season]}
+            continue
+        analyses = {episode: load_counter(show_dir, f'episode/{season}/{episode}') for episode in show_map[season] if episode not in results[season]}
+        analyses.update(results[season])
+        seasons[season] = save_season_aggregates(show_dir, season, analyses)
+        episode_frequency[season] = {episode: analysis[0] for episode, analysis in analyses.items()}
+        for episode, analysis in results[season].items():
+            sentiment[(season, episode)] = format_sentiment(*analysis[2:4])
+            episode_words.setdefault(season, {})[episode] = analysis[5]
+            if arcs is not None:
+                arcs[(season, episode)] = analysis[4]
+    save_show_aggregates(show_dir, seasons, sentiment, episode_frequency, episode_words)
+    # Arcs of a show imported before they existed would only cover the new episodes, so they wait for a re-import
+    if arcs is not None:
+        save_arcs(show_dir, arcs, key=episode_key)
+
+### Import stages
+
+def no_progress(stage, done, total):
+    # Default progress callback; the job queue passes one that records progress and checks for cancellation
+    pass
+
+TOPIC_REGEX = regex.compile(r"t=(\d+)")
+
+FORUM_PAGE_SIZE = 78
+
+def get_topic_ids(soup):
     pages = []
-
-    for i in tqdm(range(pageCount), desc=f'[1/4] Scraping {title}'):
-        url = 'https://transcripts.foreverdreaming.org/viewforum.php?f=' + str(show) + '&start=' + str(i * 78)
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        for link in soup.find_all('a'):
-            if link.get('href') and 'viewtopic.php' in link.get('href'):
-                search = topicRegex.search(link.get('href'))
-                if (search):
-                    pages.append(search.group(1))
+    for link in soup.find_all('a'):
+        if link.get('href') and 'viewtopic.php' in link.get('href'):
+            search = TOPIC_REGEX.search(link.get('href'))
+            if (search):
+                pages.append(search.group(1))
+    return pages
+
+async def scrape_show_async(show, show_dir=None, progress=no_progress):
+    cache_dir = f'{show_dir}/raw' if show_dir else None
+    async with Scraper(cache_dir=cache_dir) as scraper:
+        def listing(i):
+            return f'viewforum.php?f={show}&start={i * FORUM_PAGE_SIZE}', f'{cache_dir}/forum/{i}.html' if cache_dir else None
+
+        soup = BeautifulSoup(await scraper.fetch(*listing(0)), 'html.parser')
+
+        title = soup.find('h2', class_='forum-title').text
+
+        pageCount = 1
+        for a in soup.find('div', class_='pagination').find_all('a'):
+            if a.text.isdigit() and int(a.text) > pageCount:
+                pageCount = int(a.text)
+
+        pages = get_topic_ids(soup)
+
+        with tqdm(total=pageCount, desc=f'[1/4] Scraping {title}') as pbar:
+            pbar.update()
+            progress('scrape', pbar.n, pageCount)
+            async def scrape_listing(i):
+                text = await scraper.fetch(*listing(i))
+                pbar.update()
+                progress('scrape', pbar.n, pageCount)
+                return get_topic_ids(BeautifulSoup(text, 'html.parser'))
+            for topic_ids in await asyncio.gather(*[scrape_listing(i) for i in range(1, pageCount)]):
+                pages += topic_ids
 
     pages = list(set(pages))
 
     if '32146' in pages:
         pages.remove('32146')
 
-    pages = list(map(lambda x: 'https://transcripts.foreverdreaming.org/viewtopic.php?t=' + x, pages))
-
-    ### Download all pages
-
-    def download_page(page):
-        response = requests.get(page + '&view=print')
-        page_id = page.split("=")[1]
-        with open(f'{SHOW_DIR}/raw/{page_id}.html', 'w', encoding='utf-8') as f:
-            f.write(response.text)
-        return page_id
-
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        futures = {executor.submit(download_page, page): page for page in pages}
-        for future in tqdm(as_completed(futures), total=len(futures), desc='[2/4] Downloading pages'):
-            future.result()
-
-    ## Format pages
-
-    pages = os.listdir(f'{SHOW_DIR}/raw')
-
-    with open("util/uncensor.json") as f:
-        uncensor = json.load(f)
-
-    def uncensor_line(line):
-        for word in uncensor.keys():
-            line = line.replace(word, uncensor[word])
-        return line
-
+    return title, pages
+
+def scrape_show(show, show_dir=None, progress=no_progress):
+    return asyncio.run(scrape_show_async(show, show_dir, progress))
+
+async def download_pages_async(show_dir, page_ids, on_page=None, progress=no_progress):
+    async with Scraper(cache_dir=f'{show_dir}/raw') as scraper:
+        with tqdm(total=len(page_ids), desc='[2/4] Downloading pages') as pbar:
+            async def download_page(page_id):
+                await scraper.fetch(f'viewtopic.php?t={page_id}&view=print', f'{show_dir}/raw/{page_id}.html')
+                pbar.update()
+                progress('download', pbar.n, len(page_ids))
+                if on_page:
+                    await on_page(page_id)
+                return page_id
+            await asyncio.gather(*[download_page(page_id) for page_id in page_ids])
+
+def format_page(show_dir, page, uncensor):
+    with open(f'{show_dir}/raw/{page}', 'r', encoding='utf-8') as f:
+        html = f.read()
+    with span('parse_html'):
+        soup = BeautifulSoup(html, 'html.parser')
+    title = soup.find('h2').text
+    try:
+        season = title.split('x')[0]
+        episode = title.split('x')[1].split(' ')[0]
+    except:
+        season = "other"
+        episode = title
+    path = f"{show_dir}/formatted/{season}"
+    Path(path).mkdir(exist_ok=True, parents=True)
+    content = soup.find('div', class_='content')
+    text = content.text
+    map_title = title
+    with span('uncensor'):
+        title = uncensor(title)
+        formatted_text = uncensor(text)
+    with open(f'{path}/{episode}.txt', 'w', encoding='utf-8') as f:
+        f.write(f"{title}\n{formatted_text}")
+    return season, f'{episode}.txt', map_title
+
+### Streaming import pipeline
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self.blocked = 0.0
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def begin(self):
+        self.started = time.perf_counter()
+
+    def record(self, items, busy):
+        with self.lock:
+            now = time.perf_counter()
+            if self.started is None:
+                self.started = now - busy
+            self.finished = now
+            self.items += items
+            self.busy += busy
+
+    def as_dict(self):
+        wall = (self.finished - self.started) if self.finished is not None else 0
+        return {'items': self.items, 'wall': wall, 'rate': self.items / wall if wall else 0, 'busy': self.busy, 'waiting': self.waiting, 'blocked': self.blocked}
+
+    def report(self):
+        stats = self.as_dict()
+        return f'{self.name}: {stats["items"]} pages in {stats["wall"]:.1f}s ({stats["rate"]:.1f}/s), busy {self.busy:.1f}s, waiting for input {self.waiting:.1f}s, blocked on output {self.blocked:.1f}s'
+
+def timed_analyze_episodes(show_dir, episodes):
+    # Runs in a worker process, so its timings travel back with the results instead of going to metrics directly
+    start = time.perf_counter()
+    timings = {}
+    results = analyze_episodes(show_dir, episodes, timings)
+    return time.perf_counter() - start, timings, results
+
+def run_pipeline(show_dir, page_ids, workers=ANALYSIS_WORKERS, batch_size=ANALYSIS_BATCH_SIZE, queue_size=PIPELINE_QUEUE_SIZE, progress=no_progress):
+    # Each page moves download -> format -> analysis as soon as it is ready; the bounded queues apply backpressure
+    # progress(stage, done, total) may raise to stop the import, which then fails like any other stage error
+    downloaded = queue.Queue(maxsize=queue_size)
+    formatted = queue.Queue(maxsize=queue_size)
+    stats = {name: StageStats(name) for name in ('download', 'format', 'analyze')}
+    failed = threading.Event()
+    errors = []
     show_map = {}
     episode_ids = {}
-
-    for page in tqdm(pages, desc='[3/4] Formatting pages'):
-        with open(f'{SHOW_DIR}/raw/{page}', 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f.read(), 'html.parser')
-            title = soup.find('h2').text
+    results = {}
+
+    def fail(error):
+        errors.append(error)
+        failed.set()
+
+    def take(source, stage):
+        start = time.perf_counter()
+        item = source.get()
+        stage.waiting += time.perf_counter() - start
+        return item
+
+    def give(target, stage, item):
+        start = time.perf_counter()
+        target.put(item)
+        stage.blocked += time.perf_counter() - start
+
+    def download_stage():
+        # Downloads overlap each other, so this stage only reports its rate and how long it was held back
+        stats['download'].begin()
+        async def on_page(page_id):
+            if failed.is_set():
+                raise Exception('Import pipeline stopped')
+            stats['download'].record(1, 0)
+            await asyncio.to_thread(give, downloaded, stats['download'], f'{page_id}.html')
+        try:
+            asyncio.run(download_pages_async(show_dir, page_ids, on_page=on_page, progress=progress))
+        except Exception as e:
+            fail(e)
+        finally:
+            downloaded.put(None)
+
+    def format_stage():
+        # The end marker is always sent, so analysis stops even if this stage dies
+        try:
+            uncensor = load_uncensor()
+            with tqdm(total=len(page_ids), desc='[3/4] Formatting pages') as pbar:
+                while (page := take(downloaded, stats['format'])) is not None:
+                    if failed.is_set():
+                        continue
+                    start = time.perf_counter()
+                    try:
+                        season, episode, title = format_page(show_dir, page, uncensor)
+                        show_map.setdefault(season, {})[episode] = title
+                        episode_ids.setdefault(season, {})[episode] = page.split('.')[0]
+                        stats['format'].record(1, time.perf_counter() - start)
+                        pbar.update()
+                        progress('format', pbar.n, len(page_ids))
+                    except Exception as e:
+                        fail(e)
+                        continue
+                    give(formatted, stats['format'], (season, episode))
+        except Exception as e:
+            fail(e)
+            # Drained so the download stage is not left blocked on a full queue
+            while downloaded.get() is not None:
+                pass
+        finally:
+            formatted.put(None)
+
+    def analyze_stage(executor, pbar):
+        futures = []
+        batch = []
+        dispatched = set()
+        rewritten = set()
+        def submit(batch):
+            future = executor.submit(timed_analyze_episodes, show_dir, batch)
+            future.add_done_callback(collect)
+            futures.append(future)
+            return future
+        def collect(future):
             try:
-                season = title.split('x')[0]
-                episode = title.split('x')[1].split(' ')[0]
-            except:
-                season = "other"
-                episode = title
-            if not show_map.get(season):
-                show_map[season] = {}
-                episode_ids[season] = {}
-            show_map[season][f'{episode}.txt'] = title
-            episode_ids[season][f'{episode}.txt'] = page.split('.')[0]
-            path = f"{SHOW_DIR}/formatted/{season}"
-            Path(path).mkdir(exist_ok=True, parents=True)
-            content = soup.find('div', class_='content')
-            text = content.text
-            if '*' in title:
-                title = uncensor_line(title)
-            formatted_text = '\n'.join([uncensor_line(line) for line in text.split('\n')])
-            with open(f'{path}/{episode}.txt', 'w', encoding='utf-8') as f:
-                f.write(f"{title}\n{formatted_text}")
-
-    with open(f'{SHOW_DIR}/meta/map.json', 'w', encoding='utf-8') as f:
+                busy, timings, episodes = future.result()
+            except Exception as e:
+                fail(e)
+                return
+            metrics.observe('oneirocrit_span_seconds', busy, span='analyze_batch')
+            for name, seconds in timings.items():
+                metrics.observe('oneirocrit_span_seconds', seconds, span=name)
+            for season, episode, *analysis in episodes:
+                results.setdefault(season, {})[episode] = analysis
+            stats['analyze'].record(len(episodes), busy)
+            pbar.update(len(episodes))
+            try:
+                progress('analyze', pbar.n, len(page_ids))
+            except Exception as e:
+                fail(e)
+        while (episode := take(formatted, stats['analyze'])) is not None:
+            if failed.is_set():
+                continue
+            # Two topics can format to the same file; analyze it again once formatting is done
+            if episode in dispatched:
+                rewritten.add(episode)
+                continue
+            dispatched.add(episode)
+            batch.append(episode)
+            if len(batch) >= batch_size:
+                submit(batch)
+                batch = []
+        if batch and not failed.is_set():
+            submit(batch)
+        if failed.is_set():
+            # Batches that have not started yet are dropped rather than analyzed for nothing
+            for future in futures:
+                future.cancel()
+        wait(futures)
+        if rewritten and not failed.is_set():
+            wait([submit(sorted(rewritten))])
+
+    threads = [threading.Thread(target=download_stage, daemon=True), threading.Thread(target=format_stage, daemon=True)]
+    for thread in threads:
+        thread.start()
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_nlp) as executor:
+        with tqdm(total=len(page_ids), desc='[4/4] Analyzing Show') as pbar:
+            analyze_stage(executor, pbar)
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    for stage in stats.values():
+        print(stage.report())
+    return show_map, episode_ids, results, {name: stage.as_dict() for name, stage in stats.items()}
+
+def save_meta(show_dir, show_map, episode_ids, topic_ids):
+    with open(f'{show_dir}/meta/map.json', 'w', encoding='utf-8') as f:
             json.dump(show_map, f)
 
-    with open(f'{SHOW_DIR}/meta/ids.json', 'w', encoding='utf-8') as f:
+    with open(f'{show_dir}/meta/ids.json', 'w', encoding='utf-8') as f:
             json.dump(episode_ids, f)
 
-    ### Analysis
-
-    def get_text_from_episode(season, episode):
-        episode_path = f'{SHOW_DIR}/formatted/{season}/{episode}'
-        with open(episode_path, 'r', encoding='utf-8') as f:
-            return '\n'.join(f.readlines()[1:])
-
-
-    def save_frequency_to_file(path, analysis):
-        save_path = Path(f'{SHOW_DIR}/analysis/word_frequency/{path}')
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(save_path, 'w', encoding='utf-8') as f:
-            for word, freq in Counter(analysis).most_common():
-                f.write(f'{word}: {freq}\n')
-
-    def save_order_to_file(path, analysis):
-        save_path = Path(f'{SHOW_DIR}/analysis/word_order/{path}')
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(save_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(analysis))
+    # Every topic downloaded so far; ids.json keeps one per episode file, but several topics can format to the same one
+    with open(f'{show_dir}/meta/topics.json', 'w', encoding='utf-8') as f:
+            json.dump(sorted(topic_ids), f)
+
+def load_meta(show_dir):
+    with open(f'{show_dir}/meta/map.json', 'r', encoding='utf-8') as f:
+        show_map = json.load(f)
+    with open(f'{show_dir}/meta/ids.json', 'r', encoding='utf-8') as f:
+        episode_ids = json.load(f)
+    return show_map, episode_ids
+
+def load_topic_ids(show_dir, episode_ids):
+    try:
+        with open(f'{show_dir}/meta/topics.json', 'r', encoding='utf-8') as f:
+            return set(json.load(f))
+    except FileNotFoundError:
+        # Shows imported before topics.json existed: the recorded ids and every downloaded page
+        pages = {page.split('.')[0] for page in list_folder(show_dir, 'raw') if page.endswith('.html')}
+        return pages | {page_id for episodes in episode_ids.values() for page_id in episodes.values()}
+
+def add_show(show, show_name, workers=ANALYSIS_WORKERS, batch_size=ANALYSIS_BATCH_SIZE, progress=no_progress):
+    ### SETUP
+    SHOW_DIR = f'{PARENT_DIR}/{show}'
+    if os.path.isdir(SHOW_DIR):
+        raise Exception(f'Attempted to import show {show_name} but it already exists! To reimport, delete the show directory ({SHOW_DIR}) and try again.')
+    Path(SHOW_DIR).mkdir(exist_ok=True)
+    Path(f'{SHOW_DIR}/meta').mkdir(exist_ok=True)
+    Path(f'{SHOW_DIR}/raw').mkdir(exist_ok=True)
 
-    def save_sentiment_to_file(analysis):
-        save_path = Path(f'{SHOW_DIR}/analysis/sentiment.txt')
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(save_path, 'w', encoding='utf-8') as f:
-            for episode, sentiment in analysis.items():
-                f.write(f'{episode}: {sentiment}\n')
+    print(f'Importing {show_name}...')
 
-    def remove_duplicates(analysis):
-        return list(OrderedDict.fromkeys(analysis))
+    ### Get a list of all pages for the show
 
-    nlp = spacy.load('en_core_web_sm')
-    nlp.add_pipe('spacytextblob')
+    with span('scrape'):
+        title, page_ids = scrape_show(show, SHOW_DIR, progress)
+    with open(f'{SHOW_DIR}/meta/title.txt', 'w', encoding='utf-8') as file:
+        file.write(title)
 
-    def complete_analysis():
-        show_frequency = Counter()
-        show_order = []
-        show_sentiment = {}
-        show_path = f'{SHOW_DIR}/formatted'
-        seasons = os.listdir(show_path)
-
-        def analyze_episode(season, episode):
-            text = get_text_from_episode(season, episode)
-            doc = nlp(text)
-            tokens = [token for token in doc if token.is_alpha and not token.is_stop]
-            words = [f'{token.lemma_.lower()}_{token.pos_}' for token in tokens]
-            word_freq = Counter(words)
-            save_frequency_to_file(f'episode/{season}/{episode}', words)
-            word_order = remove_duplicates(words)
-            save_order_to_file(f'episode/{season}/{episode}', word_order)
-            polarity = doc._.blob.polarity
-            subjectivity = doc._.blob.subjectivity
-            return season, episode, word_freq, word_order, polarity, subjectivity
-
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = []
-            for season in seasons:
-                season_path = f'{show_path}/{season}'
-                episodes = os.listdir(season_path)
-                for episode in episodes:
-                    futures.append(executor.submit(analyze_episode, season, episode))
-
-            with tqdm(total=len(futures), desc="[4/4] Analyzing Show") as pbar:
-                season_frequency = {}
-                season_order = {}
-                for future in as_completed(futures):
-                    season, episode, word_freq, word_order, polarity, subjectivity = future.result()
-                    if season not in season_frequency:
-                        season_frequency[season] = Counter()
-                        season_order[season] = []
-                    season_frequency[season].update(word_freq)
-                    season_order[season] += [word for word in word_order if word not in season_order[season]]
-                    show_sentiment[f'{season}x{episode}'] = f'{round(polarity, 3)} {round(subjectivity, 3)}'
-                    pbar.update()
-
-                for season in seasons:
-                    save_frequency_to_file(f'season/{season}.txt', season_frequency[season])
-                    show_frequency.update(season_frequency[season])
-                    save_order_to_file(f'season/{season}.txt', season_order[season])
-                    show_order += [word for word in season_order[season] if word not in show_order]
-
-            save_frequency_to_file('show.txt', show_frequency)
-            save_order_to_file('show.txt', show_order)
-            save_sentiment_to_file(show_sentiment)
-    complete_analysis()
-    print(f'Imported {show_name}!')
\ No newline at end of file
+    ### Download, format and analyze every page as a stream
+
+    with span('pipeline'):
+        show_map, episode_ids, results, _ = run_pipeline(SHOW_DIR, page_ids, workers=workers, batch_size=batch_size, progress=progress)
+    progress('save', 0, 1)
+    save_meta(SHOW_DIR, show_map, episode_ids, page_ids)
+    with span('save_aggregates'):
+        save_aggregates(SHOW_DIR, results)
+    with span('build_search_index'):
+        build_search_index(SHOW_DIR)
+    if PACK_SHOWS or is_packed(SHOW_DIR):
+        with span('pack'):
+            pack_show(SHOW_DIR)
+    write_data_version(SHOW_DIR)
+    update_manifest(show)
+    progress('save', 1, 1)
+    print(f'Imported {show_name}!')
+
+def update_show(show, show_name, workers=ANALYSIS_WORKERS, batch_size=ANALYSIS_BATCH_SIZE, progress=no_progress):
+    SHOW_DIR = f'{PARENT_DIR}/{show}'
+    if not os.path.isdir(SHOW_DIR):
+        raise Exception(f'Attempted to update show {show_name} but it has not been imported yet!')
+
+    print(f'Updating {show_name}...')
+
+    show_map, episode_ids = load_meta(SHOW_DIR)
+    known_ids = load_topic_ids(SHOW_DIR, episode_ids)
+    with span('scrape'):
+        _, page_ids = scrape_show(show, SHOW_DIR, progress)
+    new_ids = [page_id for page_id in page_ids if page_id not in known_ids]
+    if not new_ids:
+        print(f'{show_name} is already up to date!')
+        return
+
+    with span('pipeline'):
+        new_map, new_episode_ids, results, _ = run_pipeline(SHOW_DIR, new_ids, workers=workers, batch_size=batch_size, progress=progress)
+    progress('save', 0, 1)
+    for season in new_map:
+        show_map.setdefault(season, {}).update(new_map[season])
+        episode_ids.setdefault(season, {}).update(new_episode_ids[season])
+    save_meta(SHOW_DIR, show_map, episode_ids, known_ids | set(new_ids))
+
+    episodes = [(season, episode) for season in new_map for episode in new_map[season]]
+    with span('save_aggregates'):
+        patch_aggregates(SHOW_DIR, show_map, results)
+    with span('build_search_index'):
+        build_search_index(SHOW_DIR)
+    if PACK_SHOWS or is_packed(SHOW_DIR):
+        with span('pack'):
+            pack_show(SHOW_DIR)
+    write_data_version(SHOW_DIR)
+    update_manifest(show)
+    progress('save', 1, 1)
+    print(f'Updated {show_name} with {len(episodes)} new or changed episodes!')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import a show from forever dreaming.')
+    parser.add_argument('show', help='forum id of the show')
+    parser.add_argument('--name', help='name to report while importing (defaults to the forum id)')
+    parser.add_argument('--workers', type=int, default=ANALYSIS_WORKERS, help='number of spaCy worker processes')
+    parser.add_argument('--update', action='store_true', help='only fetch and analyze episodes that are new since the last import')
+    args = parser.parse_args()
+    if args.update:
+        update_show(args.show, args.name or args.show, workers=args.workers)
+    else:
+        add_show(args.show, args.name or args.show, workers=args.workers)
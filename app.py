@@ -1,19 +1,46 @@
+import cProfile
+import functools
+import gzip
 import json
 import matplotlib
 import os
+import shutil
+import time
 import webbrowser
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, make_response
 from flask_caching import Cache
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-from util.constants import PARENT_DIR
-from add_show import add_show
-from visualize import generate_heatmap, generate_line_plot, generate_wordcloud, generate_sentiment
+from util.archive import read_text
+from util.arcs import load_arcs, get_episode_arc, get_show_arc
+from util.cache import memory_cache
+from util.catalog import load_catalog, search_catalog
+from util.constants import PARENT_DIR, ANALYSIS_WORKERS, FORUMS_FILE, IMPORTS_ENABLED, PROFILE_DIR, SHARED_CACHE_DIR
+from util.counts import load_count_matrix
+from util.frequency import get_frequency_page, get_order_page, load_frequency_table
+from util.jobs import FINISHED_STATES, JobCancelled, job_queue
+from util.manifest import get_show_detail, get_show_listing, list_shows, sync_shows
+from util.metrics import metrics
+from util.plot_cache import plot_cache
+from util.search import load_search_index, search
+from util.version import get_data_version, make_request_key
+from add_show import add_show, update_show
+from visualize import generate_heatmap, generate_line_plot, generate_wordcloud, generate_sentiment, generate_compare_plot, compare_shows, get_word_series
 
 matplotlib.use('Agg')
 app = Flask(__name__)
 app.json.ensure_ascii = False
 
+# Worker processes of the production server share cached responses through a directory. Its entry count is not
+# tracked (threshold 0), as the count file is not safe to update from several processes; entries expire instead
 cache = Cache(app, config={
+    'CACHE_TYPE': 'FileSystemCache',
+    'CACHE_DIR': SHARED_CACHE_DIR,
+    'CACHE_THRESHOLD': 0
+} if SHARED_CACHE_DIR else {
     'CACHE_TYPE': 'simple',
     'CACHE_THRESHOLD': 50
 })
@@ -21,6 +48,102 @@ cache = Cache(app, config={
 if not os.path.isdir(PARENT_DIR):
     os.mkdir(PARENT_DIR)
 
+@app.before_request
+def start_request():
+    g.started = time.perf_counter()
+    if sync_shows():
+        cache.clear()
+    # Opt-in profiling: only when ONEIROCRIT_PROFILE_DIR is set and the request asks for it
+    if PROFILE_DIR and request.args.get('profile') == 'true':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def finish_request(response):
+    profiler = g.pop('profiler', None)
+    if profiler:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        file = f'{PROFILE_DIR}/{time.time_ns()}-{request.endpoint}.prof'
+        profiler.dump_stats(file)
+        response.headers['X-Profile'] = file
+    if 'started' in g:
+        metrics.observe('oneirocrit_request_seconds', time.perf_counter() - g.started, endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+def plot_cached(view):
+    # Serves rendered plots from the on-disk plot cache, with ETag revalidation
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = plot_cache.make_key(request.path, request.args)
+        if key in request.if_none_match:
+            response = make_response('', 304)
+            response.set_etag(key)
+            return response
+        entry = plot_cache.get(key)
+        if entry:
+            mimetype, body = entry
+            response = make_response(body)
+            response.mimetype = mimetype
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                plot_cache.put(key, response.mimetype, response.get_data())
+        if response.status_code == 200:
+            response.set_etag(key)
+        return response
+    return wrapper
+
+def compress(response):
+    # Brotli when the client takes it and the module is installed, otherwise gzip
+    body = response.get_data()
+    accepted = request.accept_encodings
+    if len(body) < 1024:
+        return response
+    if brotli and accepted['br']:
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def data_endpoint(view):
+    # JSON data endpoints: weak ETags on the show's data version, and compressed bodies
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = make_request_key(request.path, request.args)
+        if request.if_none_match.contains_weak(key):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            response = compress(response)
+        response.set_etag(key, weak=True)
+        response.vary.add('Accept-Encoding')
+        return response
+    return wrapper
+
+def get_list_arg(name):
+    value = request.args.get(name)
+    return value.split(',') if value else None
+
+IMAGE_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+def get_image_output():
+    output = request.args.get('format') or 'base64'
+    if output != 'base64' and output not in IMAGE_MIMETYPES:
+        raise Exception(f'Unknown image format {output}')
+    return output
+
+def image_response(image, output):
+    # base64 text keeps the original response shape for script.js
+    response = make_response(image)
+    if output in IMAGE_MIMETYPES:
+        response.mimetype = IMAGE_MIMETYPES[output]
+    return response
+
 ### ENDPOINTS
 
 @app.route('/')
@@ -33,8 +156,8 @@ def read_file():
     path = request.args.get('path')
     path = path.replace('..', '').replace('//', '/').replace('\\', '/').lstrip('/')
     try:
-        with open(f'{PARENT_DIR}/{path}', 'r', encoding='utf-8') as f:
-            content = f.read()
+        show, path = path.split('/', 1)
+        content = read_text(f'{PARENT_DIR}/{show}', path)
         return jsonify(content)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -42,58 +165,70 @@ def read_file():
 @app.route('/api/forums')
 @cache.cached(timeout=86400)
 def list_forums():
-    with open('util/forums.json', encoding='utf-8') as f:
+    with open(FORUMS_FILE, encoding='utf-8') as f:
         forums = json.load(f)
     return jsonify(forums)
 
+@app.route('/api/catalog')
+def search_forums():
+    # Importable forums matching q, best match first; without q, every forum by title
+    query = request.args.get('q') or ''
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', 50, type=int)
+    try:
+        return jsonify(search_catalog(query, offset=offset, limit=limit))
+    except Exception as e:
+        print(e)
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/showinfo')
-@cache.memoize(timeout=86400)
 def show_info():
-    shows = os.listdir(PARENT_DIR)
-    response = {
-        'maps': {},
-        'titles': {},
-        'ids': {}
-    }
-    for show in shows:
-        with open(f'{PARENT_DIR}/{show}/meta/map.json', encoding='utf-8') as f:
-            response.get('maps')[show] = json.load(f)
-        with open(f'{PARENT_DIR}/{show}/meta/title.txt', encoding='utf-8') as f:
-            response.get('titles')[show] = f.read()
-        with open(f'{PARENT_DIR}/{show}/meta/ids.json', encoding='utf-8') as f:
-            response.get('ids')[show] = json.load(f)
-    return jsonify(response)
+    # Without a show, a listing of titles and episode counts; with one, its episode map and page ids
+    show = request.args.get('show')
+    try:
+        if show:
+            return jsonify(get_show_detail(show))
+        return jsonify({'shows': get_show_listing()})
+    except Exception as e:
+        print(e)
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/api/heatmap')
-@cache.cached(timeout=300, query_string=True)
+@plot_cached
 def heatmap():
     words = request.args.get('words').split(',')
     show = request.args.get('show')
     season = request.args.get('season') or None
     smooth = request.args.get('smooth') == 'true'
+    scale = request.args.get('scale') or 'raw'
+    window = request.args.get('window', 3, type=int)
     try:
-        image = generate_heatmap(words, show, season=season, smooth_data=smooth)
-        return image
+        output = get_image_output()
+        image = generate_heatmap(words, show, season=season, smooth_data=smooth, scale=scale, window=window, output=output)
+        return image_response(image, output)
     except Exception as e:
         print(e)
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/lineplot')
-@cache.cached(timeout=300, query_string=True)
+@plot_cached
 def lineplot():
     words = request.args.get('words').split(',')
     show = request.args.get('show')
     season = request.args.get('season') or None
     smooth = request.args.get('smooth') == 'true'
+    scale = request.args.get('scale') or 'raw'
+    window = request.args.get('window', 3, type=int)
     try:
-        image = generate_line_plot(words, show, season=season, smooth_data=smooth)
-        return image
+        output = get_image_output()
+        image = generate_line_plot(words, show, season=season, smooth_data=smooth, scale=scale, window=window, output=output)
+        return image_response(image, output)
     except Exception as e:
         print(e)
         return jsonify({'error': str(e)}), 400
     
 @app.route('/api/wordcloud')
-@cache.cached(timeout=300, query_string=True)
+@plot_cached
 def wordcloud():
     width = request.args.get('width')
     height = request.args.get('height')
@@ -102,36 +237,233 @@ def wordcloud():
     episode = request.args.get('episode') or None
     filter = request.args.get('filter') or None
     try:
-        image = generate_wordcloud(width, height, show, season=season, episode=episode, part=filter)
-        return image
+        output = get_image_output()
+        image = generate_wordcloud(width, height, show, season=season, episode=episode, part=filter, output=output)
+        return image_response(image, output)
     except Exception as e:
         print(e)
         return jsonify({'error': str(e)}), 400
     
 @app.route('/api/sentiment')
-@cache.cached(timeout=300, query_string=True)
+@plot_cached
 def sentiment():
     show = request.args.get('show')
     season = request.args.get('season') or None
     try:
-        image = generate_sentiment(show, filterSeason=season)
-        return image
+        output = get_image_output()
+        image = generate_sentiment(show, filterSeason=season, output=output)
+        return image_response(image, output)
     except Exception as e:
         print(e)
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/compare')
+@plot_cached
+def compare():
+    words = request.args.get('words').split(',')
+    shows = request.args.get('shows').split(',')
+    season = request.args.get('season') or None
+    smooth = request.args.get('smooth') == 'true'
+    scale = request.args.get('scale') or ('raw' if request.args.get('normalize') == 'false' else 'per1k')
+    window = request.args.get('window', 3, type=int) if smooth else None
+    try:
+        if request.args.get('format') == 'json':
+            comparison = compare_shows(words, shows, season=season, scale=scale, window=window)
+            return jsonify({show: {**result, 'series': {word: values.tolist() for word, values in result['series'].items()}} for show, result in comparison.items()})
+        output = get_image_output()
+        image = generate_compare_plot(words, shows, season=season, scale=scale, window=window, output=output)
+        return image_response(image, output)
+    except Exception as e:
+        print(e)
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/frequency')
+@data_endpoint
+def frequency():
+    show = request.args.get('show')
+    season = request.args.get('season') or None
+    episode = request.args.get('episode') or None
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    try:
+        return get_frequency_page(show, season, episode, parts=get_list_arg('pos'), offset=offset, limit=limit, words=get_list_arg('words'))
+    except Exception as e:
+        print(e)
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/order')
+@data_endpoint
+def order():
+    show = request.args.get('show')
+    season = request.args.get('season') or None
+    episode = request.args.get('episode') or None
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    try:
+        return get_order_page(show, season, episode, parts=get_list_arg('pos'), offset=offset, limit=limit)
+    except Exception as e:
+        print(e)
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/series')
+@data_endpoint
+def series():
+    words = request.args.get('words').split(',')
+    show = request.args.get('show')
+    season = request.args.get('season') or None
+    scale = request.args.get('scale') or 'raw'
+    window = request.args.get('window', type=int)
+    try:
+        series, starts = get_word_series(words, show, season=season, scale=scale, window=window)
+        return {'starts': starts, 'series': dict(zip(words, series.tolist()))}
+    except Exception as e:
+        print(e)
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/arc')
+@data_endpoint
+def sentiment_arc():
+    # With an episode, that episode's sentence by sentence polarity; otherwise a downsampled curve over the show or season
+    show = request.args.get('show')
+    season = request.args.get('season') or None
+    episode = request.args.get('episode') or None
+    points = request.args.get('points', type=int)
+    try:
+        arcs = load_arcs(show)
+        if arcs is None:
+            raise Exception(f'No sentence sentiment for show {show}; re-import it to compute it')
+        if episode:
+            return {'season': season, 'episode': episode, 'polarity': get_episode_arc(arcs, season, episode, points).tolist()}
+        curve, episodes, starts = get_show_arc(arcs, season, points or 500)
+        return {'polarity': curve.tolist(), 'episodes': episodes, 'starts': [float(start) for start in starts]}
+    except Exception as e:
+        print(e)
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/search')
+def search_transcripts():
+    query = request.args.get('q') or ''
+    show = request.args.get('show')
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', 50, type=int)
+    shows = [show] if show else list_shows()
+    try:
+        return jsonify(search(query, shows, offset=offset, limit=limit))
+    except Exception as e:
+        print(e)
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/metrics')
+def export_metrics():
+    memory = memory_cache.stats()
+    jobs = [job.state for job in job_queue.list()]
+    gauges = [(f'oneirocrit_memory_cache_{name}', f'Memory cache {name}.', value) for name, value in memory.items()]
+    gauges += [('oneirocrit_import_jobs_active', 'Import jobs queued or running.', sum(state not in FINISHED_STATES for state in jobs))]
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache_stats')
+def cache_stats():
+    return jsonify({'memory': memory_cache.stats(), 'plots': plot_cache.stats()})
+
+def check_imports_enabled():
+    if not IMPORTS_ENABLED:
+        raise Exception('Imports are disabled on this server. Run python add_show.py <forum id> instead; the server picks the show up once it is imported')
+
+def finish_import(job):
+    memory_cache.invalidate_show(job.show)
+    cache.clear()
+
+def get_workers_arg():
+    # Each worker is a process with its own spaCy model, so requests cannot ask for more than there are CPUs
+    workers = request.args.get('workers', type=int) or ANALYSIS_WORKERS
+    return max(1, min(workers, os.cpu_count() or 1))
+
 @app.route('/api/add_show')
 def import_show():
     show = request.args.get('show')
-    name = request.args.get('name')
+    name = request.args.get('name') or show
+    workers = get_workers_arg()
+    def run(progress):
+        try:
+            add_show(show, name, workers=workers, progress=progress)
+        except JobCancelled:
+            # Leave no half imported show behind, so it can be imported again
+            shutil.rmtree(f'{PARENT_DIR}/{show}', ignore_errors=True)
+            raise
+    try:
+        check_imports_enabled()
+        job = job_queue.submit('add', show, name, run, on_done=finish_import)
+        return jsonify(job.as_dict()), 202
+    except Exception as e:
+        print(e)
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/update_show')
+def reimport_show():
+    show = request.args.get('show')
+    name = request.args.get('name') or show
+    workers = get_workers_arg()
     try:
-        add_show(show, name)
-        cache.delete_memoized(show_info)
-        return jsonify({'success': True})
+        check_imports_enabled()
+        job = job_queue.submit('update', show, name, lambda progress: update_show(show, name, workers=workers, progress=progress), on_done=finish_import)
+        return jsonify(job.as_dict()), 202
     except Exception as e:
         print(e)
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/jobs')
+def list_jobs():
+    return jsonify([job.as_dict() for job in job_queue.list()])
+
+@app.route('/api/jobs/<id>')
+def job_status(id):
+    try:
+        return jsonify(job_queue.get(id).as_dict())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 404
+
+@app.route('/api/jobs/<id>/cancel', methods=['POST'])
+def cancel_job(id):
+    try:
+        return jsonify(job_queue.cancel(id).as_dict())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 404
+
+@app.route('/api/jobs/<id>/events')
+def job_events(id):
+    # Server-Sent Events: the job's state on every change until it finishes, with keepalives while idle
+    try:
+        job = job_queue.get(id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 404
+    def stream():
+        version = None
+        while True:
+            current = job.wait(version, timeout=15)
+            if current == version:
+                yield ': keepalive\n\n'
+                continue
+            version = current
+            status = job.as_dict()
+            yield f'data: {json.dumps(status)}\n\n'
+            if status['state'] in FINISHED_STATES:
+                return
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def preload_shows():
+    # Loads the catalog and every show's indexes into the memory cache; the production server calls this before forking its workers
+    sync_shows()
+    load_catalog()
+    for show in list_shows():
+        get_data_version(show)
+        load_count_matrix(show)
+        load_frequency_table(show)
+        load_search_index(show)
+        load_arcs(show)
+
 if __name__ == '__main__':
     webbrowser.open('http://localhost:5000')
     Flask.run(app)
\ No newline at end of file
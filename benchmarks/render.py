@@ -0,0 +1,86 @@
+import argparse
+import base64
+import io
+import threading
+import time
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.colors import Normalize
+
+from visualize import frequency_plot, generate_season_labels
+
+# Latency per plot type and throughput under concurrent requests for the Figure based renderer,
+# with the pyplot one-subplot-per-word renderer it replaced as a baseline.
+# Uses synthetic data, so no imported show is needed: python -m benchmarks.render [--episodes 200 --words 8]
+
+PYPLOT_LOCK = threading.Lock()
+
+def legacy_heatmap(x, rows, words, starts, stretch_factor=1.5):
+    # pyplot keeps global state, so the old renderer could only ever draw one figure at a time
+    with PYPLOT_LOCK:
+        xy = np.column_stack([x, rows.T])
+        row_count = xy.shape[1] - 1
+        fig, axs = plt.subplots(nrows=row_count, sharex=True, figsize=(8, row_count * stretch_factor), constrained_layout=True)
+        axs = axs if row_count > 1 else [axs]
+        x = xy[:, 0]
+        extent = [x[0]-(x[1]-x[0])/2., x[-1]+(x[1]-x[0])/2.,0,1]
+        for i, ax in enumerate(axs, start=1):
+            ax.imshow(xy[:, i][np.newaxis,:], cmap='Blues', aspect='auto', extent=extent)
+            ax.set_yticks([])
+            ax.set_ylabel(words[i - 1])
+            ax.set_xlim(extent[0], extent[1])
+            ax.set_xticks(starts)
+            ax.set_xticklabels(generate_season_labels(starts))
+        buf = io.BytesIO()
+        plt.savefig(buf, format='png')
+        plt.close(fig)
+        return base64.b64encode(buf.getvalue())
+
+def make_data(episodes, words, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(1, episodes + 1)
+    rows = rng.poisson(3, (words, episodes)).astype(float)
+    starts = list(range(1, episodes + 1, 20))
+    return x, rows, [f'word{i}_NOUN' for i in range(words)], starts
+
+def time_calls(function, count, workers):
+    start = time.perf_counter()
+    if workers == 1:
+        for _ in range(count):
+            function()
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(function) for _ in range(count)]:
+                future.result()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark plot rendering.')
+    parser.add_argument('--episodes', type=int, default=200)
+    parser.add_argument('--words', type=int, default=8)
+    parser.add_argument('--count', type=int, default=20, help='plots rendered per measurement')
+    parser.add_argument('--workers', type=int, default=4, help='threads for the concurrent measurement')
+    args = parser.parse_args()
+
+    x, rows, words, starts = make_data(args.episodes, args.words)
+    sentiment = np.linspace(-0.25, 0.25, args.episodes)[np.newaxis, :]
+    plots = {
+        'legacy heatmap': lambda: legacy_heatmap(x, rows, words, starts),
+        'heatmap': lambda: frequency_plot(x, rows, words, starts=starts),
+        'heatmap png': lambda: frequency_plot(x, rows, words, starts=starts, output='png'),
+        'heatmap svg': lambda: frequency_plot(x, rows, words, starts=starts, output='svg'),
+        'line': lambda: frequency_plot(x, rows, words, starts=starts, plot_type='line'),
+        'sentiment': lambda: frequency_plot(x, sentiment, ['polarity'], starts=starts, color_map='RdYlGn', plot_type='sentiment', norm=Normalize(vmin=-0.25, vmax=0.25)),
+    }
+    print(f'{args.episodes} episodes, {args.words} words, {args.count} plots per run')
+    for name, function in plots.items():
+        function()
+        serial = time_calls(function, args.count, 1)
+        concurrent = time_calls(function, args.count, args.workers)
+        print(f'{name:16} {serial / args.count * 1000:7.1f} ms/plot   {args.count / concurrent:6.1f} plots/s with {args.workers} threads')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import numpy as np
+from pathlib import Path
+
+# End to end benchmark over synthetic shows, so results are reproducible and need no network or imported data.
+# Each corpus size gets a fresh show in foreverdreaming's print-view HTML, which is then run through the import pipeline
+# (with downloads stood in by the generated pages) and aggregated like an import, and finally requested from the plot
+# endpoints with cold and warm caches.
+# Run from the repository root: python -m benchmarks.suite [--sizes 1x10x1000 3x20x2000] [--output results.json] [--compare old.json]
+# Analysis needs the same spaCy model as an import (en_core_web_sm).
+
+DEFAULT_SIZES = ['1x10x1000', '3x20x2000', '6x24x4000']
+SHOW = '900000'
+FIRST_PAGE_ID = 100000
+
+CHARACTERS = ['Alice', 'Bob', 'Carol', 'Dave', 'Eve', 'Frank', 'Grace', 'Heidi']
+WORDS = (
+    'the a to and of you it that is in what we this me he on for your have be not do with are was my no just know '
+    'get can all here there about right so go out like up now come want think got one see well she they been time '
+    'yeah okay tell something going really back look take need let good why who where would could people never '
+    'nothing make way man little love thing over day call home talk night help money mean door house car phone '
+    'happy sad great terrible wonderful awful afraid angry beautiful dead sorry fine kind strange quiet dangerous '
+    'run walk find leave stop wait kill hate remember believe trust lie open close ask keep work kid father mother '
+    'friend doctor police case truth world life death head hand eye heart room body school job place city family'
+).split()
+CENSORED = ['k*ll', 'w*r', 'g*n', 'att*ck', 'b*mb']
+DIRECTIONS = ['[door opens]', '[phone rings]', '[laughs]', '[sighs]', '(footsteps approaching)', '[music playing]']
+
+### Synthetic corpus
+
+def parse_size(size):
+    seasons, episodes, words = (int(part) for part in size.lower().split('x'))
+    return {'name': size, 'seasons': seasons, 'episodes': episodes, 'words': words}
+
+def make_vocabulary():
+    # Zipf-like weights so the frequency tables have the long tail a real transcript has
+    vocabulary = WORDS + CHARACTERS + CENSORED
+    weights = 1 / np.arange(1, len(vocabulary) + 1) ** 1.1
+    return vocabulary, weights / weights.sum()
+
+def make_line(rng, vocabulary, weights):
+    length = int(rng.integers(4, 16))
+    words = rng.choice(vocabulary, size=length, p=weights).tolist()
+    line = ' '.join(words)
+    line = line[0].upper() + line[1:] + str(rng.choice(['.', '.', '.', '?', '!']))
+    if rng.random() < 0.6:
+        line = f'{str(rng.choice(CHARACTERS)).upper()}: {line}'
+    elif rng.random() < 0.2:
+        line = str(rng.choice(DIRECTIONS))
+    return line
+
+def make_page(rng, vocabulary, weights, season, episode, words):
+    lines = []
+    count = 0
+    while count < words:
+        lines.append(make_line(rng, vocabulary, weights))
+        count += len(lines[-1].split())
+    title = f'{season:02d}x{episode:02d} - Episode {episode}'
+    body = '<br />\n'.join(lines)
+    return f'<html><body><h2>{title}</h2><div class="content">{body}</div></body></html>'
+
+def generate_show(show_dir, size, seed=0):
+    # Writes the raw/, meta/title.txt part of a show directory and returns the page files
+    rng = np.random.default_rng(seed)
+    vocabulary, weights = make_vocabulary()
+    Path(f'{show_dir}/raw').mkdir(parents=True, exist_ok=True)
+    Path(f'{show_dir}/meta').mkdir(parents=True, exist_ok=True)
+    with open(f'{show_dir}/meta/title.txt', 'w', encoding='utf-8') as f:
+        f.write(f'Synthetic {size["name"]}')
+    pages = []
+    page_id = FIRST_PAGE_ID
+    for season in range(1, size['seasons'] + 1):
+        for episode in range(1, size['episodes'] + 1):
+            with open(f'{show_dir}/raw/{page_id}.html', 'w', encoding='utf-8') as f:
+                f.write(make_page(rng, vocabulary, weights, season, episode, size['words']))
+            pages.append(f'{page_id}.html')
+            page_id += 1
+    return pages
+
+### Measurements
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+async def download_generated(show_dir, page_ids, on_page=None, progress=None):
+    # Stands in for add_show.download_pages_async: the pages are already in raw/, so each one is handed on at once
+    for i, page_id in enumerate(page_ids):
+        if progress:
+            progress('download', i + 1, len(page_ids))
+        if on_page:
+            await on_page(page_id)
+
+def run_import(show_dir, page_ids, workers):
+    import add_show
+    download = add_show.download_pages_async
+    add_show.download_pages_async = download_generated
+    try:
+        return add_show.run_pipeline(show_dir, page_ids, workers=workers)
+    finally:
+        add_show.download_pages_async = download
+
+def run_stages(show_dir, size, workers, seed):
+    # Returns the seconds each import step took and the pipeline's own per-stage stats
+    from add_show import save_aggregates, save_meta
+    from util.manifest import update_manifest
+    from util.search import build_search_index
+    from util.version import write_data_version
+
+    stages = {}
+    stages['generate'], pages = timed(generate_show, show_dir, size, seed)
+    page_ids = [page.split('.')[0] for page in pages]
+    stages['pipeline'], (show_map, episode_ids, results, pipeline) = timed(run_import, show_dir, page_ids, workers)
+    save_meta(show_dir, show_map, episode_ids, page_ids)
+    stages['aggregate'], _ = timed(save_aggregates, show_dir, results)
+    stages['search_index'], _ = timed(build_search_index, show_dir)
+    write_data_version(show_dir)
+    update_manifest(SHOW)
+    return stages, pipeline
+
+def get_endpoints():
+    words = 'love_VERB,kill_VERB,money_NOUN,house_NOUN'
+    return {
+        'heatmap': f'/api/heatmap?show={SHOW}&words={words}&smooth=true',
+        'lineplot': f'/api/lineplot?show={SHOW}&words={words}&smooth=true',
+        'lineplot_season': f'/api/lineplot?show={SHOW}&words={words}&season=01',
+        'wordcloud': f'/api/wordcloud?show={SHOW}&width=800&height=400',
+        'wordcloud_episode': f'/api/wordcloud?show={SHOW}&width=800&height=400&season=01&episode=01.txt',
+        'sentiment': f'/api/sentiment?show={SHOW}'
+    }
+
+def clear_caches():
+    from util.cache import memory_cache
+    from util.plot_cache import plot_cache
+    memory_cache.clear()
+    shutil.rmtree(plot_cache.directory, ignore_errors=True)
+    plot_cache.size = None
+
+def time_request(client, url):
+    start = time.perf_counter()
+    response = client.get(url)
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        raise Exception(f'{url} returned {response.status_code}: {response.get_data(as_text=True)[:200]}')
+    return elapsed
+
+def run_endpoints(repeat):
+    # Cold requests start without parsed data or rendered plots; warm ones are answered from the plot cache
+    from app import app
+    client = app.test_client()
+    endpoints = {}
+    for name, url in get_endpoints().items():
+        cold = []
+        for _ in range(repeat):
+            clear_caches()
+            cold.append(time_request(client, url))
+        warm = [time_request(client, url) for _ in range(repeat)]
+        endpoints[name] = {'cold': statistics.median(cold), 'warm': statistics.median(warm)}
+    return endpoints
+
+def run_size(size, workers, repeat, seed):
+    from util.constants import PARENT_DIR
+    show_dir = f'{PARENT_DIR}/{SHOW}'
+    shutil.rmtree(show_dir, ignore_errors=True)
+    print(f'{size["name"]}: {size["seasons"]} seasons x {size["episodes"]} episodes x {size["words"]} words')
+    stages, pipeline = run_stages(show_dir, size, workers, seed)
+    result = {**size, 'stages': stages, 'pipeline': pipeline}
+    result['endpoints'] = run_endpoints(repeat)
+    for name, seconds in result['stages'].items():
+        print(f'  {name:24} {seconds * 1000:9.1f} ms')
+    for name, stats in result['pipeline'].items():
+        print(f'  {name:24} {stats["wall"] * 1000:9.1f} ms wall {stats["busy"] * 1000:9.1f} ms busy {stats["rate"]:7.1f} pages/s')
+    for name, times in result['endpoints'].items():
+        print(f'  {name:24} {times["cold"] * 1000:9.1f} ms cold {times["warm"] * 1000:9.1f} ms warm')
+    return result
+
+### Reports
+
+def flatten(results):
+    timings = {}
+    for size in results['sizes']:
+        for name, seconds in size['stages'].items():
+            timings[(size['name'], name)] = seconds
+        for name, stats in size.get('pipeline', {}).items():
+            for measure in ('wall', 'busy', 'waiting', 'blocked'):
+                timings[(size['name'], f'{name} {measure}')] = stats[measure]
+        for name, times in size['endpoints'].items():
+            for cache, seconds in times.items():
+                timings[(size['name'], f'{name} {cache}')] = seconds
+    return timings
+
+def compare(baseline, results):
+    # Prints each timing next to the baseline run's, with the ratio; above 1 is slower
+    before = flatten(baseline)
+    print(f'Compared with {baseline["created"]} ({baseline["commit"] or "unknown commit"})')
+    for (size, name), seconds in flatten(results).items():
+        if (size, name) not in before:
+            continue
+        ratio = seconds / before[(size, name)] if before[(size, name)] else float('inf')
+        print(f'  {size:12} {name:24} {before[(size, name)] * 1000:9.1f} ms -> {seconds * 1000:9.1f} ms  x{ratio:.2f}')
+
+def get_commit():
+    try:
+        with open('.git/HEAD', 'r', encoding='utf-8') as f:
+            head = f.read().strip()
+        if head.startswith('ref: '):
+            with open(f'.git/{head[5:]}', 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        return head
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark imports and plot endpoints on synthetic shows.')
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='corpus sizes as SEASONSxEPISODESxWORDS')
+    parser.add_argument('--workers', type=int, help='spaCy worker processes (defaults to ANALYSIS_WORKERS)')
+    parser.add_argument('--repeat', type=int, default=3, help='requests per endpoint measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark-results.json', help='file to write the results to')
+    parser.add_argument('--compare', help='results file from an earlier run to compare against')
+    parser.add_argument('--keep', action='store_true', help='keep the generated shows instead of deleting them')
+    args = parser.parse_args()
+
+    # Everything runs against a scratch data and plot cache directory, set before the app modules read their constants
+    scratch = tempfile.mkdtemp(prefix='oneirocrit-bench-')
+    os.environ['ONEIROCRIT_DATA_DIR'] = f'{scratch}/forever_dreaming'
+    os.environ['ONEIROCRIT_PLOT_CACHE_DIR'] = f'{scratch}/plots'
+    os.mkdir(os.environ['ONEIROCRIT_DATA_DIR'])
+    from util.constants import ANALYSIS_WORKERS
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'workers': args.workers or ANALYSIS_WORKERS,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'sizes': []
+    }
+    try:
+        for size in args.sizes:
+            results['sizes'].append(run_size(parse_size(size), results['workers'], args.repeat, args.seed))
+    finally:
+        if args.keep:
+            print(f'Generated shows kept in {scratch}')
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), results)
+
+if __name__ == '__main__':
+    main()
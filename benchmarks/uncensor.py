@@ -0,0 +1,78 @@
+import argparse
+import glob
+import json
+import random
+import time
+from bs4 import BeautifulSoup
+
+from util.constants import PARENT_DIR
+from util.uncensor import Uncensor
+
+# Micro-benchmark of the uncensor engine against the per-line, per-key loop it replaced.
+# Run from the repository root: python -m benchmarks.uncensor [--shows 1662 ...]
+
+def legacy_uncensor(uncensor, text):
+    def uncensor_line(line):
+        for word in uncensor.keys():
+            line = line.replace(word, uncensor[word])
+        return line
+    return '\n'.join([uncensor_line(line) for line in text.split('\n')])
+
+def load_corpus(shows, limit):
+    pattern = [f'{PARENT_DIR}/{show}/raw/*.html' for show in shows] if shows else [f'{PARENT_DIR}/*/raw/*.html']
+    texts = []
+    for path in sorted(file for p in pattern for file in glob.glob(p))[:limit]:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = BeautifulSoup(f.read(), 'html.parser').find('div', class_='content')
+        if content:
+            texts.append(content.text)
+    return texts
+
+def fuzz_corpus(uncensor, count, seed=0):
+    # Dense, overlapping fragments of censored words to exercise ordering edge cases
+    rng = random.Random(seed)
+    fragments = list(uncensor) + [word[:len(word) // 2] for word in uncensor] + [word[len(word) // 2:] for word in uncensor] + [' ', '\n', 'a', 'e']
+    return [''.join(rng.choice(fragments) for _ in range(200)) for _ in range(count)]
+
+def best_of(function, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            function(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the uncensor engine with the legacy per-key loop.')
+    parser.add_argument('--shows', nargs='*', help='forum ids of imported shows to use as the corpus (default: all)')
+    parser.add_argument('--limit', type=int, default=500, help='maximum number of transcripts to load')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with open('util/uncensor.json') as f:
+        replacements = json.load(f)
+    engine = Uncensor(replacements)
+
+    fuzz = fuzz_corpus(replacements, 2000)
+    mismatches = sum(engine(text) != legacy_uncensor(replacements, text) for text in fuzz)
+    print(f'fuzz check: {len(fuzz)} texts, {mismatches} mismatches')
+
+    texts = load_corpus(args.shows, args.limit)
+    if not texts:
+        print(f'No raw transcripts found under {PARENT_DIR}/; import a show first.')
+        return
+    mismatches = sum(engine(text) != legacy_uncensor(replacements, text) for text in texts)
+    characters = sum(len(text) for text in texts)
+    print(f'corpus: {len(texts)} transcripts, {characters / 1e6:.1f}M characters, {mismatches} mismatches')
+
+    legacy = best_of(lambda text: legacy_uncensor(replacements, text), texts, args.repeat)
+    engine.rewrite_line.cache_clear()
+    compiled = best_of(engine, texts, args.repeat)
+    print(f'legacy loop: {legacy * 1000:.1f} ms ({characters / legacy / 1e6:.1f} MB/s)')
+    print(f'engine:      {compiled * 1000:.1f} ms ({characters / compiled / 1e6:.1f} MB/s)')
+    print(f'speedup:     {legacy / compiled:.1f}x')
+
+if __name__ == '__main__':
+    main()
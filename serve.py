@@ -0,0 +1,67 @@
+import argparse
+import os
+
+# Headless production server: several worker processes under gunicorn, sharing the on-disk plot cache and a filesystem
+# response cache. Shows are preloaded before the workers are forked, so every worker starts with warm indexes.
+# With more than one worker, imports are left to python add_show.py; running workers pick new shows up on their next request.
+# python serve.py [--workers 4 --threads 4 --bind 0.0.0.0:5000]
+
+def run_gunicorn(app, options):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+def main():
+    # Settings are read from the environment here, as they have to be in place before the app is imported
+    parser = argparse.ArgumentParser(description='Run Oneirocrit as a multi-process server.')
+    parser.add_argument('--bind', default='127.0.0.1:5000', help='address and port to listen on')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('ONEIROCRIT_SERVER_WORKERS', os.cpu_count() or 1)), help='worker processes')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('ONEIROCRIT_SERVER_THREADS', 4)), help='threads per worker')
+    parser.add_argument('--cache-dir', default=os.environ.get('ONEIROCRIT_SHARED_CACHE_DIR', 'cache/shared'), help='directory the workers share cached responses through')
+    args = parser.parse_args()
+
+    try:
+        import gunicorn
+    except ImportError:
+        gunicorn = None
+    os.environ['ONEIROCRIT_SHARED_CACHE_DIR'] = args.cache_dir
+    # Job progress lives in the process running the import, so imports need a single process
+    os.environ.setdefault('ONEIROCRIT_IMPORTS', 'true' if args.workers == 1 or not gunicorn else 'false')
+    from app import app, preload_shows
+    preload_shows()
+
+    if gunicorn:
+        run_gunicorn(app, {
+            'bind': args.bind,
+            'workers': args.workers,
+            'threads': args.threads,
+            'worker_class': 'gthread',
+            # The app is already imported and preloaded, so workers share its memory until they write to it
+            'preload_app': True,
+            # Import progress streams stay open for as long as an import runs
+            'timeout': 120,
+            'accesslog': '-'
+        })
+        return
+
+    # gunicorn does not run on Windows; waitress serves one process with a thread pool instead
+    print('gunicorn is not installed, serving from a single process')
+    host, port = args.bind.rsplit(':', 1)
+    try:
+        from waitress import serve
+    except ImportError:
+        from werkzeug.serving import run_simple
+        run_simple(host, int(port), app, threaded=True)
+        return
+    serve(app, host=host, port=int(port), threads=args.workers * args.threads)
+
+if __name__ == '__main__':
+    main()
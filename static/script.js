@@ -31,7 +31,24 @@ function clearNav() {
 }
 
 function getShowTitle(show) {
-    return showTitles[show] || show
+    return (shows[show] || {}).title || show
+}
+
+async function loadShow(show) {
+    // Episode maps and page ids are only fetched for shows that are opened
+    if (!showMap[show]) {
+        const showInfo = await getJSONfromAPI(`showinfo?show=${encodeURIComponent(show)}`)
+        showMap[show] = showInfo.map
+        episodeIds[show] = showInfo.ids
+    }
+    return showMap[show]
+}
+
+async function loadShows() {
+    const showInfo = await getJSONfromAPI('showinfo')
+    shows = showInfo.shows
+    showMap = {}
+    episodeIds = {}
 }
 
 function getSeasonTitle(season) {
@@ -47,7 +64,7 @@ function getEpisodeTitle(episode) {
 }
 
 function getAiredRange(show) {
-    const foundShow = forums.find(el => el.id === show)
+    const foundShow = shows[show]
     if (!foundShow) return 'Unknown (Show not found)'
     if (!foundShow.range) return 'Unknown (Range not found)'
     return foundShow.range
@@ -110,26 +127,15 @@ function addPathBar(show = null, season = null, episode = null) {
 }
 
 function countEpisodes(show, season = null) {
-    let count = 0
-    if (season) {
-        const episodes = Object.keys(showMap[show][season])
-        count = episodes.length
-    } else {
-        const seasons = Object.keys(showMap[show])
-        seasons.forEach((season) => {
-            const episodes = Object.keys(showMap[show][season])
-            count += episodes.length
-        })
-    }
-    return count
+    if (season) return shows[show].seasons[season]
+    return shows[show].episodes
 }
 
 function navigateOverview() {
     clearNav()
     addPathBar()
-    const shows = Object.keys(showMap)
     const showList = document.createElement('ul')
-    shows.forEach((show) => {
+    Object.keys(shows).forEach((show) => {
         const showItem = document.createElement('li')
         showItem.textContent = getShowTitle(show)
         const episodeCount = document.createElement('span')
@@ -153,7 +159,7 @@ function navigateOverview() {
 function navigateShow(show) {
     clearNav()
     addPathBar(show)
-    const seasons = Object.keys(showMap[show]).sort((a, b) => Number.parseInt(a) - Number.parseInt(b))
+    const seasons = Object.keys(shows[show].seasons).sort((a, b) => Number.parseInt(a) - Number.parseInt(b))
     const seasonList = document.createElement('ul')
     seasons.forEach((season) => {
         const seasonItem = document.createElement('li')
@@ -174,7 +180,8 @@ function navigateShow(show) {
     setSource(show)
 }
 
-function navigateSeason(show, season) {
+async function navigateSeason(show, season) {
+    await loadShow(show)
     clearNav()
     addPathBar(show, season)
     const episodes = Object.keys(showMap[show][season])
@@ -201,7 +208,8 @@ function navigateSeason(show, season) {
     setSource(show, season)
 }
 
-function navigateEpisode(show, season, episode) {
+async function navigateEpisode(show, season, episode) {
+    await loadShow(show)
     clearNav()
     addPathBar(show, season, episode)
     const path = `${show}/formatted/${season}/${episode}`
@@ -236,22 +244,24 @@ function setSource(show = null, season = null, episode = null) {
     }
 }
 
-async function getFrequency(show, season = null, episode = null) {
-    let path = `${show}/analysis/word_frequency`
-    if (episode) path += `/episode/${season}/${episode}`
-    else if (season) path += `/season/${season}.txt`
-    else path += `/show.txt`
-    const text = await readFile(path)
-    return text
+function analysisQuery(show, season = null, episode = null) {
+    const params = new URLSearchParams({ show })
+    if (season) params.set('season', season)
+    if (episode) params.set('episode', episode)
+    return params
 }
 
-async function getOrder(show, season = null, episode = null) {
-    let path = `${show}/analysis/word_order`
-    if (episode) path += `/episode/${season}/${episode}`
-    else if (season) path += `/season/${season}.txt`
-    else path += `/show.txt`
-    const text = await readFile(path)
-    return text
+async function getFrequency(show, season = null, episode = null, limit = null, words = []) {
+    const params = analysisQuery(show, season, episode)
+    if (limit) params.set('limit', limit)
+    if (words.length) params.set('words', words.join(','))
+    return await getJSONfromAPI(`frequency?${params}`)
+}
+
+async function getOrder(show, season = null, episode = null, limit = null) {
+    const params = analysisQuery(show, season, episode)
+    if (limit) params.set('limit', limit)
+    return await getJSONfromAPI(`order?${params}`)
 }
 
 function updateAnalysisDisplay(show = null, season = null, episode = null) {
@@ -265,37 +275,37 @@ function updateAnalysisDisplay(show = null, season = null, episode = null) {
     }
     frequency.textContent = 'Requesting Data...'
     // order.textContent = 'Requesting Data...'
-    getFrequency(show, season, episode).then((text) => {
+    const fastMode = document.querySelector('.quick-mode').textContent === 'Quick Mode'
+    const markedWords = getMarkedWords().map((word) => {
+        const [key, part] = word.split('_')
+        return `${key.toLowerCase()}_${part}`
+    })
+    getFrequency(show, season, episode, fastMode ? 500 : null, markedWords).then((data) => {
         requestAnimationFrame(() => {
         frequency.textContent = 'Loading...'
-        const fastMode = document.querySelector('.quick-mode').textContent === 'Quick Mode'
         setTimeout(() => {
-            asyncFrequencyUpdate(text, fastMode)
+            asyncFrequencyUpdate(data, fastMode)
         }, 0)
         })
     }).catch((e) => {
         console.error('Error fetching frequency:', e)
     })
-    // getOrder(show, season, episode).then((text) => {
-    //     asyncOrderUpdate(text)
+    // getOrder(show, season, episode).then((data) => {
+    //     asyncOrderUpdate(data)
     // })
 }
 
-async function asyncFrequencyUpdate(text, fast = true) {
+async function asyncFrequencyUpdate(data, fast = true) {
     frequency.textContent = ''
     const list = document.createElement('ul')
-    const frequencyArray = text.split('\n')
-    frequencyArray.forEach((word, index) => {
-        if (word === '') frequencyArray.splice(index, 1)
-    })
+    const frequencyArray = data.entries
     frequency.appendChild(list)
     const markedWords = getMarkedWords()
     clearMarkedWordCounts()
-    let length = frequencyArray.length
-    if (fast) length = Math.min(length, 500)
+    const length = frequencyArray.length
     const updatedWords = []
     for (let index = 0; index < length; index++) {
-        const word = frequencyArray[index]
+        const [word, wordCount] = frequencyArray[index]
 
         const entry = document.createElement('li')
         entry.className = 'filterable'
@@ -305,11 +315,9 @@ async function asyncFrequencyUpdate(text, fast = true) {
         number.textContent = `${index + 1}. `
 
         let key = word.split('_')
-        key.pop()
+        const part = key.pop()
         key = key.join('_')
-        let part = word.split('_')
-        part = part[part.length - 1].split(':')[0]
-        const count = nf.format(word.split(': ')[1])
+        const count = nf.format(wordCount)
 
         if (part === 'PROPN') key = key[0].toUpperCase() + key.slice(1)
 
@@ -329,7 +337,7 @@ async function asyncFrequencyUpdate(text, fast = true) {
         }
         entry.textContent = `${key}: ${count}`
         entry.dataset.word = key
-        entry.dataset.count = word.split(': ')[1]
+        entry.dataset.count = wordCount
         entry.dataset.type = part
         entry.title = filterNames[part]
         entry.insertBefore(number, entry.firstChild)
@@ -339,11 +347,8 @@ async function asyncFrequencyUpdate(text, fast = true) {
         const unupdatedWords = markedWords.filter((word) => !updatedWords.includes(word))
         unupdatedWords.forEach((word) => {
             const [key, part] = word.split('_')
-            const entry = frequencyArray.find((el) => el.startsWith(key.toLowerCase() + '_'))
-            if (entry) {
-                const count = nf.format(entry.split(': ')[1])
-                updateMarkedWord(key, part, count)
-            }
+            const wordCount = (data.words || {})[`${key.toLowerCase()}_${part}`]
+            if (wordCount) updateMarkedWord(key, part, nf.format(wordCount))
         })
     }
     const filterLabel = document.querySelector('.filter-label')
@@ -351,12 +356,9 @@ async function asyncFrequencyUpdate(text, fast = true) {
     applySearch()
 }
 
-async function asyncOrderUpdate(text) {
+async function asyncOrderUpdate(data) {
     const list = document.createElement('ul');
-    const orderArray = text.split('\n');
-    orderArray.forEach((word, index) => {
-        if (word === '') orderArray.splice(index, 1);
-    });
+    const orderArray = data.entries;
     order.textContent = '';
     order.appendChild(list);
     const increment = Math.floor(orderArray.length / 10)
@@ -635,7 +637,7 @@ function initCollapsibleBars() {
             }
         })
     })
-    if (Object.keys(showMap).length === 0) {
+    if (Object.keys(shows).length === 0) {
         const helpBar = document.querySelector('.help')
         const helpArrow = helpBar.querySelector('.arrow')
         helpArrow.click()
@@ -682,8 +684,7 @@ async function frequencyGraph(button, type) {
                 visualizationContent.removeChild(visualizationContent.firstChild)
             }
         }
-        let shows = Object.keys(showMap)
-        for (const show of shows) {
+        for (const show of Object.keys(shows)) {
             await visualizeWords(words, type, show, null, smooth, true)
         }
         return
@@ -900,19 +901,62 @@ function applySearch(term = null) {
     lastSearchedTerm = term
 }
 
-function searchForums(substring) {
-    const forums = document.querySelectorAll('.import ul li')
-    forums.forEach((forum) => {
-        if (forum.dataset.title.toLowerCase().includes(substring.toLowerCase())) forum.style.display = 'list-item'
-        else forum.style.display = 'none'
+const catalogPageSize = 50
+let catalogPage = null
+let catalogLoading = false
+
+async function getCatalogPage(query, offset = 0) {
+    return await getJSONfromAPI(`catalog?q=${encodeURIComponent(query)}&offset=${offset}&limit=${catalogPageSize}`)
+}
+
+function createImportItem(forum) {
+    const importItem = document.createElement('li')
+    importItem.textContent = forum.title
+    importItem.title = forum.desc
+    importItem.dataset.title = forum.title
+    importItem.dataset.id = forum.id
+    const importEpisodeCount = document.createElement('span')
+    importEpisodeCount.textContent = `${nf.format(forum.episodes)} Episode${(forum.episodes === 1) ? '' : 's'}`
+    importEpisodeCount.className = 'right'
+    importItem.appendChild(importEpisodeCount)
+    importItem.addEventListener('click', () => {
+       importShow(forum)
     })
+    return importItem
+}
+
+function showCatalogPage(importList, page) {
+    // A new query replaces the list; further pages of the same query are appended as the list is scrolled
+    if (page.offset === 0) {
+        while (importList.firstChild) importList.removeChild(importList.firstChild)
+        importList.scrollTop = 0
+    }
+    page.forums.forEach((forum) => importList.appendChild(createImportItem(forum)))
+    catalogPage = page
+}
+
+async function searchForums(substring) {
+    const page = await getCatalogPage(substring)
+    // Results for an older query can arrive after the current one
+    if (!page || substring !== document.querySelector('.import input').value.trim()) return
+    showCatalogPage(document.querySelector('.import-list'), page)
     if (substring !== '') {
         const importArrow = document.querySelector('.import .arrow')
         if (importArrow.textContent === '▼') importArrow.click()
     }
 }
 
-function createImportBar() {
+async function loadMoreForums(importList) {
+    const shown = catalogPage.offset + catalogPage.forums.length
+    if (catalogLoading || shown >= catalogPage.total) return
+    catalogLoading = true
+    const query = catalogPage.query
+    const page = await getCatalogPage(query, shown)
+    catalogLoading = false
+    if (page && catalogPage.query === query) showCatalogPage(importList, page)
+}
+
+function createImportBar(page) {
     const importBar = document.querySelector('.import')
     const importTitle = document.createElement('p')
     importTitle.textContent = 'Import'
@@ -920,51 +964,79 @@ function createImportBar() {
     importSearch.type = 'text'
     importSearch.placeholder = 'Search Forums...'
     importSearch.className = 'right'
-    importSearch.addEventListener('change', (event) => {
-        searchForums(event.target.value.trim())
+    let searchTimeout = null
+    importSearch.addEventListener('input', (event) => {
+        clearTimeout(searchTimeout)
+        searchTimeout = setTimeout(() => searchForums(event.target.value.trim()), 200)
     })
     importTitle.appendChild(importSearch)
     importBar.appendChild(importTitle)
     const importList = document.createElement('ul')
     importList.className = 'import-list'
-    forums.forEach((forum) => {
-        const importItem = document.createElement('li')
-        importItem.textContent = forum.title
-        importItem.title = forum.desc
-        importItem.dataset.title = forum.title
-        importItem.dataset.id = forum.id
-        const importEpisodeCount = document.createElement('span')
-        importEpisodeCount.textContent = `${nf.format(forum.episodes)} Episode${(forum.episodes === 1) ? '' : 's'}`
-        importEpisodeCount.className = 'right'
-        importItem.appendChild(importEpisodeCount)
-        importItem.addEventListener('click', () => {
-           importShow(forum)
-        })
-        importList.appendChild(importItem)
+    importList.addEventListener('scroll', () => {
+        if (importList.scrollTop + importList.clientHeight >= importList.scrollHeight - 20) loadMoreForums(importList)
     })
+    showCatalogPage(importList, page)
     importBar.appendChild(importList)
 }
 
+const importStages = {
+    'scrape': 'Scraping forum',
+    'download': 'Downloading',
+    'format': 'Formatting',
+    'analyze': 'Analyzing',
+    'save': 'Saving'
+}
+
+function describeImport(job) {
+    const stages = Object.entries(job.stages).map(([stage, counts]) => `${importStages[stage] || stage} ${nf.format(counts.done)}/${nf.format(counts.total)}`)
+    if (job.state === 'queued') return `Waiting to import ${job.name}...`
+    return `Importing ${job.name}: ${stages.join(', ') || 'starting...'}`
+}
+
 function importShow(forum) {
     const importList = document.querySelector('.import-list')
     importList.remove()
     const progress = document.createElement('p')
-    progress.textContent = `Currently importing ${forum.title}. Check the server console for progress.`
+    progress.textContent = `Currently importing ${forum.title}...`
+    const cancelButton = document.createElement('button')
+    cancelButton.textContent = 'Cancel'
+    cancelButton.className = 'right'
     const importBar = document.querySelector('.import')
     importBar.appendChild(progress)
-    fetch(`/api/add_show?show=${forum.id}&name=${encodeURIComponent(forum.title)}`).then( async(response) => {
-        if (response.ok) {
-            let showInfo = await getJSONfromAPI('showinfo')
-            showMap = showInfo.maps
-            showTitles = showInfo.titles
-            episodeIds = showInfo.ids
-            if (document.querySelector('.path-bar').childNodes.length === 1) {
-                navigateOverview()
+    importBar.appendChild(cancelButton)
+    const finish = () => {
+        cancelButton.remove()
+        importBar.appendChild(importList)
+    }
+    fetch(`/api/add_show?show=${forum.id}&name=${encodeURIComponent(forum.title)}`).then(async(response) => {
+        const job = await response.json()
+        if (!response.ok) {
+            progress.textContent = `Error importing ${forum.title}: ${job.error}`
+            finish()
+            return
+        }
+        cancelButton.addEventListener('click', () => {
+            cancelButton.disabled = true
+            fetch(`/api/jobs/${job.id}/cancel`, { method: 'POST' })
+        })
+        const events = new EventSource(`/api/jobs/${job.id}/events`)
+        events.onmessage = async(event) => {
+            const status = JSON.parse(event.data)
+            progress.textContent = describeImport(status)
+            if (status.state === 'queued' || status.state === 'running') return
+            events.close()
+            if (status.state === 'done') {
+                await loadShows()
+                if (document.querySelector('.path-bar').childNodes.length === 1) {
+                    navigateOverview()
+                }
+                progress.remove()
             }
-            progress.remove()
-            importBar.appendChild(importList)
+            else if (status.state === 'cancelled') progress.textContent = `Cancelled importing ${forum.title}.`
+            else progress.textContent = `Error importing ${forum.title}: ${status.error}`
+            finish()
         }
-        else progress.textContent = `Error importing ${forum.title}. Check the server console for details.`
     })
 }
 
@@ -992,10 +1064,9 @@ function createQuickModeButton() {
     frequencyBar.append(quickModeButton)
 }
 
+let shows = {}
 let showMap = {}
-let showTitles = {}
 let episodeIds = {}
-let forums = []
 let nav = document.querySelector('.nav-content')
 let frequency = document.querySelector('.frequency-content')
 // let order = document.querySelector('.order-content')
@@ -1014,17 +1085,14 @@ nav.oncontextmenu = () => {
 document.addEventListener('DOMContentLoaded', async() => {
     const pathBar = document.querySelector('.path-bar')
     pathBar.textContent = 'Loading... (0/2)'
-    let showInfo = await getJSONfromAPI('showinfo')
+    await loadShows()
     pathBar.textContent = 'Loading... (1/2)'
-    showMap = showInfo.maps
-    showTitles = showInfo.titles
-    episodeIds = showInfo.ids
-    forums = await getJSONfromAPI('forums')
+    const forums = await getCatalogPage('')
     pathBar.textContent = 'Loading... (2/2)'
     navigateOverview()
     updateSavedPages()
     createFilterBar()
-    createImportBar()
+    createImportBar(forums)
     createHelpBar()
     initCollapsibleBars()
     setupVisualization()
@@ -0,0 +1,142 @@
+import asyncio
+import functools
+import threading
+import time
+import httpx
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import add_show
+from util.scraper import Scraper
+from util.uncensor import load_uncensor
+
+# Checks the scraper against a local stand-in for foreverdreaming, serving saved listing and print-view pages.
+# Run from the repository root: python -m pytest tests
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+REPO_DIR = Path(__file__).parent.parent
+
+def read_fixture(name):
+    return (FIXTURES / name).read_text(encoding='utf-8')
+
+class StandIn:
+    # Each path answers with its queued responses in order, repeating the last one; every request is recorded
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stand_in.requests.append((self.path, dict(self.headers)))
+                responses = stand_in.routes.get(self.path.lstrip('/'), [(404, {}, '')])
+                status, headers, body = responses.pop(0) if len(responses) > 1 else responses[0]
+                data = body.encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def route(self, path, *responses):
+        self.routes[path] = list(responses)
+
+    def count(self, path):
+        return sum(1 for requested, _ in self.requests if requested.lstrip('/') == path)
+
+@pytest.fixture
+def stand_in():
+    stand_in = StandIn()
+    thread = threading.Thread(target=stand_in.server.serve_forever, daemon=True)
+    thread.start()
+    yield stand_in
+    stand_in.server.shutdown()
+    stand_in.server.server_close()
+
+def fetch(stand_in, path, file=None, cache_dir=None, **options):
+    async def run():
+        async with Scraper(cache_dir=cache_dir, base_url=stand_in.url, rate=0, **options) as scraper:
+            return await scraper.fetch(path, file)
+    return asyncio.run(run())
+
+### Retries
+
+def test_retries_server_errors(stand_in):
+    page = read_fixture('viewtopic_print.html')
+    stand_in.route('viewtopic.php?t=50002&view=print', (503, {}, ''), (502, {}, ''), (200, {}, page))
+    assert fetch(stand_in, 'viewtopic.php?t=50002&view=print', backoff=0) == page
+    assert stand_in.count('viewtopic.php?t=50002&view=print') == 3
+
+def test_gives_up_after_retries(stand_in):
+    stand_in.route('viewtopic.php?t=50002&view=print', (500, {}, ''))
+    with pytest.raises(httpx.HTTPStatusError):
+        fetch(stand_in, 'viewtopic.php?t=50002&view=print', retries=2, backoff=0)
+    assert stand_in.count('viewtopic.php?t=50002&view=print') == 3
+
+def test_does_not_retry_client_errors(stand_in):
+    stand_in.route('viewtopic.php?t=1&view=print', (404, {}, ''))
+    with pytest.raises(httpx.HTTPStatusError):
+        fetch(stand_in, 'viewtopic.php?t=1&view=print', backoff=0)
+    assert stand_in.count('viewtopic.php?t=1&view=print') == 1
+
+def test_waits_for_retry_after(stand_in):
+    page = read_fixture('viewtopic_print.html')
+    stand_in.route('viewtopic.php?t=50002&view=print', (429, {'Retry-After': '1'}, ''), (200, {}, page))
+    start = time.monotonic()
+    assert fetch(stand_in, 'viewtopic.php?t=50002&view=print', backoff=0.01) == page
+    assert time.monotonic() - start >= 1
+
+### Conditional requests
+
+def test_reuses_file_on_not_modified(stand_in, tmp_path):
+    page = read_fixture('viewtopic_print.html')
+    path = 'viewtopic.php?t=50002&view=print'
+    file = tmp_path / '50002.html'
+    stand_in.route(path, (200, {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2018 00:00:00 GMT'}, page), (304, {}, ''))
+    assert fetch(stand_in, path, file, cache_dir=tmp_path) == page
+    # A new scraper reads the validators back from cache.json
+    assert fetch(stand_in, path, file, cache_dir=tmp_path) == page
+    headers = stand_in.requests[-1][1]
+    assert headers['If-None-Match'] == '"v1"'
+    assert headers['If-Modified-Since'] == 'Mon, 01 Jan 2018 00:00:00 GMT'
+    assert file.read_text(encoding='utf-8') == page
+
+def test_refetches_without_file(stand_in, tmp_path):
+    # Validators are only sent when the downloaded file is still there to fall back on
+    page = read_fixture('viewtopic_print.html')
+    path = 'viewtopic.php?t=50002&view=print'
+    file = tmp_path / '50002.html'
+    stand_in.route(path, (200, {'ETag': '"v1"'}, page))
+    fetch(stand_in, path, file, cache_dir=tmp_path)
+    file.unlink()
+    assert fetch(stand_in, path, file, cache_dir=tmp_path) == page
+    assert 'If-None-Match' not in stand_in.requests[-1][1]
+
+### Forum pages
+
+def test_scrapes_listing(stand_in, monkeypatch):
+    stand_in.route('viewforum.php?f=1234&start=0', (200, {}, read_fixture('viewforum.html')))
+    stand_in.route('viewforum.php?f=1234&start=78', (200, {}, read_fixture('viewforum_2.html')))
+    monkeypatch.setattr(add_show, 'Scraper', functools.partial(Scraper, base_url=stand_in.url, rate=0))
+    title, pages = add_show.scrape_show('1234')
+    assert title == 'The Example Show'
+    # The forum rules topic is pinned to every listing and is not an episode
+    assert sorted(pages) == ['50001', '50002', '50003', '50004']
+
+def test_formats_print_view(tmp_path):
+    (tmp_path / 'raw').mkdir()
+    (tmp_path / 'raw' / '50002.html').write_text(read_fixture('viewtopic_print.html'), encoding='utf-8')
+    uncensor = load_uncensor(REPO_DIR / 'util' / 'uncensor.json')
+    assert add_show.format_page(tmp_path, '50002.html', uncensor) == ('01', '02.txt', '01x02 - The Second One')
+    text = (tmp_path / 'formatted' / '01' / '02.txt').read_text(encoding='utf-8')
+    assert text.startswith('01x02 - The Second One\nPreviously on The Example Show...')
+    assert 'BOB: They were going to kill us, and you know it.' in text
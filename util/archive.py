@@ -0,0 +1,188 @@
+import argparse
+import gzip
+import json
+import os
+import shutil
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from util.cache import memory_cache
+from util.constants import PARENT_DIR
+
+### Packed show storage: raw pages, formatted transcripts and word frequency/order files in one compressed archive
+# Members are compressed one by one and found through an offset index, so a read only decompresses the file it needs.
+# Loose files win over packed ones, which lets an update write new episodes next to a packed show until it is repacked.
+
+PACKED_DIRS = ('raw', 'formatted', 'analysis/word_frequency', 'analysis/word_order')
+# Kept loose because the scraper reads and rewrites it in place
+LOOSE_FILES = {'raw/cache.json'}
+
+def get_archive_dir(show_dir):
+    return f'{show_dir}/archive'
+
+def get_default_codec():
+    return 'zstd' if zstandard else 'gzip'
+
+def compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    raise Exception(f'Unknown archive codec {codec}, expected zstd or gzip')
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        if not zstandard:
+            raise Exception('This show is packed with zstd, install the zstandard module to read it')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def is_packed(show_dir):
+    return os.path.isfile(f'{get_archive_dir(show_dir)}/index.json')
+
+def load_archive(show_dir):
+    # The index is reloaded whenever index.json changes, so a repack by the migration command is picked up without a restart
+    file = f'{get_archive_dir(show_dir)}/index.json'
+    try:
+        mtime = os.stat(file).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return memory_cache.get_fresh(('archive', os.path.basename(show_dir), show_dir), mtime, lambda: read_archive(show_dir))
+
+def read_archive(show_dir):
+    with open(f'{get_archive_dir(show_dir)}/index.json', 'r', encoding='utf-8') as f:
+        archive = json.load(f)
+    # Directory listings: each folder in the archive and the names directly inside it
+    folders = {}
+    for path in archive['members']:
+        parts = path.split('/')
+        for depth in range(len(parts)):
+            folders.setdefault('/'.join(parts[:depth]), set()).add(parts[depth])
+    archive['folders'] = {folder: sorted(names) for folder, names in folders.items()}
+    return archive
+
+def read_member(show_dir, archive, path):
+    offset, length = archive['members'][path]
+    with open(f'{get_archive_dir(show_dir)}/{archive["file"]}', 'rb') as f:
+        f.seek(offset)
+        return decompress(f.read(length), archive['codec'])
+
+def read_text(show_dir, path):
+    # path is relative to the show directory, e.g. formatted/01/01.txt
+    try:
+        with open(f'{show_dir}/{path}', 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        archive = load_archive(show_dir)
+        if not archive or path not in archive['members']:
+            raise
+    return read_member(show_dir, archive, path).decode('utf-8')
+
+def list_folder(show_dir, path):
+    # Names directly inside a folder, loose or packed; empty when the folder exists in neither
+    names = set(os.listdir(f'{show_dir}/{path}')) if os.path.isdir(f'{show_dir}/{path}') else set()
+    archive = load_archive(show_dir)
+    if archive:
+        names.update(archive['folders'].get(path, []))
+    return sorted(names)
+
+def folder_exists(show_dir, path):
+    archive = load_archive(show_dir)
+    return os.path.isdir(f'{show_dir}/{path}') or bool(archive and path in archive['folders'])
+
+### Packing and unpacking
+
+def list_loose_files(show_dir):
+    files = []
+    for folder in PACKED_DIRS:
+        for root, _, names in os.walk(f'{show_dir}/{folder}'):
+            for name in names:
+                path = os.path.relpath(f'{root}/{name}', show_dir).replace(os.sep, '/')
+                if path not in LOOSE_FILES and not name.endswith('.tmp'):
+                    files.append(path)
+    return sorted(files)
+
+def remove_empty_folders(show_dir):
+    for folder in PACKED_DIRS:
+        for root, _, _ in sorted(os.walk(f'{show_dir}/{folder}'), key=lambda entry: -len(entry[0])):
+            if not os.listdir(root):
+                os.rmdir(root)
+
+def pack_show(show_dir, codec=None):
+    # Merges loose files into the show's archive (writing a new one if needed) and deletes them
+    codec = codec or get_default_codec()
+    archive_dir = get_archive_dir(show_dir)
+    os.makedirs(archive_dir, exist_ok=True)
+    old = read_archive(show_dir) if is_packed(show_dir) else None
+    loose = list_loose_files(show_dir)
+    if old and old['codec'] == codec and not loose:
+        return 0
+    generation = old['generation'] + 1 if old else 1
+    file = f'members-{generation}.bin'
+    members = {}
+    with open(f'{archive_dir}/{file}', 'wb') as out:
+        def add(path, data):
+            members[path] = [out.tell(), len(data)]
+            out.write(data)
+        if old:
+            with open(f'{archive_dir}/{old["file"]}', 'rb') as f:
+                for path, (offset, length) in old['members'].items():
+                    if os.path.isfile(f'{show_dir}/{path}'):
+                        continue
+                    f.seek(offset)
+                    data = f.read(length)
+                    # Members are copied as they are unless the archive changes codec
+                    add(path, data if old['codec'] == codec else compress(decompress(data, old['codec']), codec))
+        for path in loose:
+            # Read as text so members hold the same newlines a loose read would return
+            with open(f'{show_dir}/{path}', 'r', encoding='utf-8') as f:
+                add(path, compress(f.read().encode('utf-8'), codec))
+    index = {'version': 1, 'codec': codec, 'generation': generation, 'file': file, 'members': dict(sorted(members.items()))}
+    temp = f'{archive_dir}/index.json.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(temp, f'{archive_dir}/index.json')
+    if old:
+        os.remove(f'{archive_dir}/{old["file"]}')
+    for path in loose:
+        os.remove(f'{show_dir}/{path}')
+    remove_empty_folders(show_dir)
+    return len(loose)
+
+def unpack_show(show_dir):
+    # Writes every packed member back out as a loose file and removes the archive
+    if not is_packed(show_dir):
+        return 0
+    archive = read_archive(show_dir)
+    count = 0
+    for path in archive['members']:
+        if os.path.isfile(f'{show_dir}/{path}'):
+            continue
+        os.makedirs(os.path.dirname(f'{show_dir}/{path}'), exist_ok=True)
+        with open(f'{show_dir}/{path}', 'wb') as f:
+            f.write(read_member(show_dir, archive, path))
+        count += 1
+    shutil.rmtree(get_archive_dir(show_dir))
+    return count
+
+def get_size(show_dir):
+    return sum(os.path.getsize(f'{root}/{name}') for root, _, names in os.walk(show_dir) for name in names)
+
+if __name__ == '__main__':
+    from util.manifest import list_show_dirs
+
+    parser = argparse.ArgumentParser(description='Pack imported shows into compressed archives, or unpack them again.')
+    parser.add_argument('shows', nargs='*', help='forum ids of the shows (defaults to every imported show)')
+    parser.add_argument('--unpack', action='store_true', help='restore loose files and remove the archives')
+    parser.add_argument('--codec', choices=['zstd', 'gzip'], help=f'compression for new archives (defaults to {get_default_codec()})')
+    args = parser.parse_args()
+    if args.codec == 'zstd' and not zstandard:
+        parser.error('zstd needs the zstandard module')
+
+    for show in args.shows or list_show_dirs():
+        show_dir = f'{PARENT_DIR}/{show}'
+        before = get_size(show_dir)
+        count = unpack_show(show_dir) if args.unpack else pack_show(show_dir, args.codec)
+        print(f'{show}: {"unpacked" if args.unpack else "packed"} {count} files, {before / 2**20:.1f} MB -> {get_size(show_dir) / 2**20:.1f} MB')
@@ -0,0 +1,79 @@
+import json
+import os
+import numpy as np
+from pathlib import Path
+
+from util.cache import memory_cache
+from util.constants import PARENT_DIR
+from util.counts import save_array
+
+### Sentence level sentiment: every sentence's polarity in one float32 array, sliced per episode by an offset table
+
+def get_arc_dir(show_dir):
+    return f'{show_dir}/analysis/arcs'
+
+def save_arcs(show_dir, arcs, key):
+    # arcs maps (season, episode) to that episode's sentence polarities; key orders the episodes
+    episodes = sorted(arcs, key=key)
+    offsets = np.zeros(len(episodes) + 1, dtype=np.int64)
+    np.cumsum([len(arcs[episode]) for episode in episodes], out=offsets[1:])
+    polarity = np.concatenate([np.asarray(arcs[episode], dtype=np.float32) for episode in episodes]) if episodes else np.empty(0, dtype=np.float32)
+    arc_dir = Path(get_arc_dir(show_dir))
+    arc_dir.mkdir(parents=True, exist_ok=True)
+    save_array(arc_dir / 'polarity.npy', polarity)
+    save_array(arc_dir / 'offsets.npy', offsets)
+    temp = arc_dir / f'episodes.json.{os.getpid()}.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump([list(episode) for episode in episodes], f, ensure_ascii=False)
+    os.replace(temp, arc_dir / 'episodes.json')
+
+def load_arc_episodes(show_dir):
+    # Every stored episode's polarities, for re-saving after an incremental update; None for shows imported before arcs
+    arc_dir = get_arc_dir(show_dir)
+    if not os.path.isfile(f'{arc_dir}/episodes.json'):
+        return None
+    with open(f'{arc_dir}/episodes.json', 'r', encoding='utf-8') as f:
+        episodes = json.load(f)
+    polarity = np.load(f'{arc_dir}/polarity.npy')
+    offsets = np.load(f'{arc_dir}/offsets.npy')
+    return {(season, episode): polarity[offsets[i]:offsets[i + 1]] for i, (season, episode) in enumerate(episodes)}
+
+def load_arcs(show):
+    return memory_cache.get(('arcs', show), lambda: read_arcs(show))
+
+def read_arcs(show):
+    arc_dir = get_arc_dir(f'{PARENT_DIR}/{show}')
+    if not os.path.isfile(f'{arc_dir}/episodes.json'):
+        return None
+    with open(f'{arc_dir}/episodes.json', 'r', encoding='utf-8') as f:
+        episodes = json.load(f)
+    return {
+        'episodes': episodes,
+        'index': {(season, episode): i for i, (season, episode) in enumerate(episodes)},
+        'polarity': np.load(f'{arc_dir}/polarity.npy', mmap_mode='r'),
+        'offsets': np.load(f'{arc_dir}/offsets.npy', mmap_mode='r')
+    }
+
+def downsample(values, points):
+    # Mean of equal-width buckets; series already short enough are returned as they are
+    if not points or len(values) <= points:
+        return np.asarray(values, dtype=np.float32)
+    edges = np.linspace(0, len(values), points + 1).astype(np.int64)
+    return (np.add.reduceat(values, edges[:-1], dtype=np.float64) / np.diff(edges)).astype(np.float32)
+
+def get_episode_arc(arcs, season, episode, points=None):
+    i = arcs['index'].get((season, episode))
+    if i is None:
+        raise Exception(f'Episode {season}x{episode} not found in sentence sentiment')
+    return downsample(arcs['polarity'][arcs['offsets'][i]:arcs['offsets'][i + 1]], points)
+
+def get_show_arc(arcs, season=None, points=500):
+    # The show's (or season's) sentences end to end, and where each episode starts on the returned curve
+    rows = [i for i, (episode_season, _) in enumerate(arcs['episodes']) if season is None or episode_season == season]
+    if not rows:
+        raise Exception(f'Season {season} not found in sentence sentiment')
+    start, end = arcs['offsets'][rows[0]], arcs['offsets'][rows[-1] + 1]
+    curve = downsample(arcs['polarity'][start:end], points)
+    ratio = len(curve) / (end - start) if end > start else 0
+    starts = [(arcs['offsets'][row] - start) * ratio for row in rows]
+    return curve, [arcs['episodes'][row] for row in rows], starts
@@ -0,0 +1,89 @@
+import sys
+import threading
+import numpy as np
+from collections import OrderedDict
+
+from util.constants import MEMORY_CACHE_BUDGET
+
+def estimate_size(value):
+    if isinstance(value, np.memmap):
+        return sys.getsizeof(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+class MemoryCache:
+    # Keys are tuples of (kind, show, ...) so that a whole show can be dropped after an import
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, loader):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def get_fresh(self, key, mtime, loader):
+        # For values read from a file: stored with the file's mtime and loaded again once that changes
+        with self.lock:
+            if key in self.entries and self.entries[key][0][0] == mtime:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0][1]
+            self.misses += 1
+        value = loader()
+        self.put(key, (mtime, value))
+        return value
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        if size > self.budget:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.budget:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def invalidate_show(self, show):
+        show = str(show)
+        with self.lock:
+            for key in [key for key in self.entries if key[1] == show]:
+                self.size -= self.entries.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'budget': self.budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+memory_cache = MemoryCache(MEMORY_CACHE_BUDGET)
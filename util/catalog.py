@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import re
+import threading
+import unicodedata
+from bs4 import BeautifulSoup
+from collections import Counter
+
+from util.cache import memory_cache
+from util.constants import FORUMS_FILE, FORUMS_INDEX_FILE
+from util.scraper import Scraper
+
+### Catalog of forums that can be imported (util/forums.json) and a search index over their titles
+# Titles are matched as a whole, then by word prefixes (every query word has to start a title word), then fuzzily by
+# shared trigrams, so typos and missing words still find the show.
+
+WORD_REGEX = re.compile(r'[a-z0-9]+')
+# Dropped before splitting titles into words, so "Grey's" and "S.H.I.E.L.D." stay single words
+JOINERS = str.maketrans('', '', '\'’.')
+# Share of the query's trigrams a title needs to have for a fuzzy match
+FUZZY_THRESHOLD = 0.6
+CATALOG_LOCK = threading.Lock()
+
+def normalize(text):
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return ' '.join(WORD_REGEX.findall(text.lower().translate(JOINERS)))
+
+def get_trigrams(text):
+    # Each word is padded like pg_trgm does, so word starts weigh more than word ends
+    return {f'  {word} '[i:i + 3] for word in text.split() for i in range(len(word) + 1)}
+
+### Index
+
+def build_index(forums):
+    titles = [normalize(forum['title']) for forum in forums]
+    tokens = {}
+    trigrams = {}
+    gram_counts = []
+    for i, title in enumerate(titles):
+        for token in set(title.split()):
+            tokens.setdefault(token, []).append(i)
+        grams = get_trigrams(title)
+        for gram in grams:
+            trigrams.setdefault(gram, []).append(i)
+        gram_counts.append(len(grams))
+    tokens = dict(sorted(tokens.items()))
+    return {
+        'titles': titles,
+        'tokens': list(tokens),
+        'token_forums': list(tokens.values()),
+        'trigrams': trigrams,
+        'gram_counts': gram_counts
+    }
+
+def write_catalog(forums):
+    # forums.json and its index are replaced together; the index records which forums.json it was built from
+    with CATALOG_LOCK:
+        temp = f'{FORUMS_FILE}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(forums, f)
+        os.replace(temp, FORUMS_FILE)
+        write_index(forums)
+
+def write_index(forums):
+    index = {'forums_mtime': os.stat(FORUMS_FILE).st_mtime_ns, **build_index(forums)}
+    os.makedirs(os.path.dirname(FORUMS_INDEX_FILE) or '.', exist_ok=True)
+    temp = f'{FORUMS_INDEX_FILE}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(temp, FORUMS_INDEX_FILE)
+    return index
+
+def load_catalog():
+    # Cached against forums.json's mtime, so a refresh from the command line is picked up
+    return memory_cache.get_fresh(('catalog', None), os.stat(FORUMS_FILE).st_mtime_ns, read_catalog)
+
+def read_catalog():
+    with open(FORUMS_FILE, 'r', encoding='utf-8') as f:
+        forums = json.load(f)
+    try:
+        with open(FORUMS_INDEX_FILE, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        index = None
+    if not index or index['forums_mtime'] != os.stat(FORUMS_FILE).st_mtime_ns:
+        index = write_index(forums)
+    return {'forums': forums, 'ids': {forum['id']: i for i, forum in enumerate(forums)}, **index}
+
+### Search
+
+def match_prefixes(catalog, words):
+    # Forums where every word starts one of the title's words
+    matches = None
+    for word in words:
+        tokens = catalog['tokens']
+        start = bisect.bisect_left(tokens, word)
+        end = bisect.bisect_left(tokens, word + '\uffff', start)
+        forums = {forum for forums in catalog['token_forums'][start:end] for forum in forums}
+        matches = forums if matches is None else matches & forums
+        if not matches:
+            break
+    return matches or set()
+
+def match_trigrams(catalog, query):
+    # Forums sharing at least FUZZY_THRESHOLD of the query's trigrams, with that share and their trigram Jaccard similarity
+    grams = get_trigrams(query)
+    shared = Counter(forum for gram in grams for forum in catalog['trigrams'].get(gram, []))
+    return {forum: (count / len(grams), count / (len(grams) + catalog['gram_counts'][forum] - count)) for forum, count in shared.items() if count / len(grams) >= FUZZY_THRESHOLD}
+
+def search_catalog(query, offset=0, limit=50):
+    catalog = load_catalog()
+    query = normalize(query or '')
+    if not query:
+        ranked = range(len(catalog['forums']))
+    else:
+        titles = catalog['titles']
+        fuzzy = match_trigrams(catalog, query)
+        prefixed = match_prefixes(catalog, query.split())
+        def rank(forum):
+            title = titles[forum]
+            tier = 0 if title == query else 1 if title.startswith(query) else 2 if forum in prefixed else 3
+            similarity, jaccard = fuzzy.get(forum, (0, 0))
+            return tier, -similarity, -jaccard, title
+        ranked = sorted(prefixed | set(fuzzy), key=rank)
+    return {
+        'query': query,
+        'total': len(ranked),
+        'offset': offset,
+        'forums': [catalog['forums'][forum] for forum in ranked[offset:offset + limit]]
+    }
+
+def get_forum(forum_id):
+    catalog = load_catalog()
+    index = catalog['ids'].get(str(forum_id))
+    return None if index is None else catalog['forums'][index]
+
+### Refresh from the forum listing
+
+FORUM_REGEX = re.compile(r'f=(\d+)')
+RANGE_REGEX = re.compile(r'(?:aired|premiered)[:;]?\s*(.*?)[\s.*]*$', re.IGNORECASE)
+
+def get_range(desc):
+    match = RANGE_REGEX.search(desc)
+    return match.group(1).replace(';', '') if match else None
+
+def parse_forum_rows(soup):
+    # Returns shows listed on a board index or forum page, and the forums that only group other forums
+    shows, containers = [], []
+    for link in soup.find_all('a', class_='forumtitle'):
+        search = FORUM_REGEX.search(link.get('href', ''))
+        row = link.find_parent('li', class_='row')
+        if not search or not row:
+            continue
+        if row.find('a', class_='subforum'):
+            containers.append(search.group(1))
+            continue
+        desc = []
+        for node in link.next_siblings:
+            # The description runs from the title to the moderator or subforum lists
+            if getattr(node, 'name', None) in ('strong', 'div', 'span'):
+                break
+            desc.append(node.get_text() if hasattr(node, 'get_text') else str(node))
+        topics = row.find('dd', class_='topics')
+        forum = {
+            'title': link.text.strip(),
+            'id': search.group(1),
+            'desc': ' '.join(''.join(desc).split()),
+            'episodes': topics.get_text(' ').split()[0].replace(',', '') if topics else '0'
+        }
+        forum_range = get_range(forum['desc'])
+        if forum_range:
+            forum['range'] = forum_range
+        shows.append(forum)
+    return shows, containers
+
+async def scrape_catalog_async():
+    # Walks the board index and every forum that groups other forums, breadth first
+    forums = {}
+    async with Scraper() as scraper:
+        pages = ['index.php']
+        seen = set()
+        while pages:
+            texts = await asyncio.gather(*[scraper.fetch(page) for page in pages])
+            pages = []
+            for text in texts:
+                shows, containers = parse_forum_rows(BeautifulSoup(text, 'html.parser'))
+                for forum in shows:
+                    forums[forum['id']] = forum
+                for forum_id in containers:
+                    if forum_id not in seen:
+                        seen.add(forum_id)
+                        pages.append(f'viewforum.php?f={forum_id}')
+    return sorted(forums.values(), key=lambda forum: normalize(forum['title']))
+
+def refresh_catalog():
+    forums = asyncio.run(scrape_catalog_async())
+    if not forums:
+        raise Exception('No forums found on the forum listing, keeping the current catalog')
+    write_catalog(forums)
+    return forums
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild the forum catalog and its search index.')
+    parser.add_argument('--index-only', action='store_true', help='rebuild the search index from the current forums.json without scraping')
+    args = parser.parse_args()
+    if args.index_only:
+        with open(FORUMS_FILE, 'r', encoding='utf-8') as f:
+            forums = json.load(f)
+        write_index(forums)
+    else:
+        forums = refresh_catalog()
+    print(f'{len(forums)} forums in {FORUMS_FILE}, index written to {FORUMS_INDEX_FILE}')
@@ -1 +1,43 @@
-PARENT_DIR = 'forever_dreaming'
\ No newline at end of file
+import os
+
+# Imported shows, one directory per forum id
+PARENT_DIR = os.environ.get('ONEIROCRIT_DATA_DIR', 'forever_dreaming')
+
+# Memory budget (bytes) for parsed frequency files and count matrices kept by visualize
+MEMORY_CACHE_BUDGET = int(os.environ.get('ONEIROCRIT_CACHE_BUDGET', 256 * 1024 * 1024))
+
+# spaCy analysis during imports: worker processes and episodes handed to each nlp.pipe call
+ANALYSIS_WORKERS = int(os.environ.get('ONEIROCRIT_ANALYSIS_WORKERS', os.cpu_count() or 1))
+ANALYSIS_BATCH_SIZE = 8
+# Pages buffered between the download, formatting and analysis stages of an import
+PIPELINE_QUEUE_SIZE = 32
+
+# Forum scraping: simultaneous requests, requests per second, retries per request and per-request timeout (seconds)
+FOREVER_DREAMING_URL = os.environ.get('ONEIROCRIT_FOREVER_DREAMING_URL', 'https://transcripts.foreverdreaming.org')
+SCRAPER_CONCURRENCY = int(os.environ.get('ONEIROCRIT_SCRAPER_CONCURRENCY', 6))
+SCRAPER_RATE_LIMIT = float(os.environ.get('ONEIROCRIT_SCRAPER_RATE_LIMIT', 5))
+SCRAPER_RETRIES = 4
+SCRAPER_TIMEOUT = 30
+
+# Rendered plots kept on disk between requests and restarts, and the size (bytes) they may grow to
+PLOT_CACHE_DIR = os.environ.get('ONEIROCRIT_PLOT_CACHE_DIR', 'cache/plots')
+PLOT_CACHE_SIZE = int(os.environ.get('ONEIROCRIT_PLOT_CACHE_SIZE', 512 * 1024 * 1024))
+
+# Background import jobs: imports allowed to run at once, and finished jobs kept for /api/jobs
+IMPORT_CONCURRENCY = int(os.environ.get('ONEIROCRIT_IMPORT_CONCURRENCY', 1))
+JOB_HISTORY = 50
+
+# Per-request cProfile dumps: requests with profile=true write a .prof file here (disabled when unset)
+PROFILE_DIR = os.environ.get('ONEIROCRIT_PROFILE_DIR')
+
+# Store new imports packed into one compressed archive per show (python -m util.archive migrates existing ones)
+PACK_SHOWS = os.environ.get('ONEIROCRIT_PACK_SHOWS') == 'true'
+
+# Forums that can be imported, and the title search index built from them
+FORUMS_FILE = 'util/forums.json'
+FORUMS_INDEX_FILE = os.environ.get('ONEIROCRIT_FORUMS_INDEX', 'cache/forums_index.json')
+
+# Set by serve.py: the directory worker processes share cached responses through (in-process when unset), and whether
+# this process may run imports
+SHARED_CACHE_DIR = os.environ.get('ONEIROCRIT_SHARED_CACHE_DIR')
+IMPORTS_ENABLED = os.environ.get('ONEIROCRIT_IMPORTS', 'true') == 'true'
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import numpy as np
+from collections import Counter
+from pathlib import Path
+
+from util.cache import memory_cache
+from util.constants import PARENT_DIR
+
+### Sparse episode x term count matrix, stored term-major (CSC) so a word is one contiguous slice
+
+def get_matrix_dir(show_dir):
+    return f'{show_dir}/analysis/matrix'
+
+def save_array(path, array):
+    # Written next to the old file and moved over it: servers may have the old one memory-mapped and keep reading it intact
+    temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp, 'wb') as f:
+        np.save(f, array)
+    os.replace(temp, path)
+
+def save_count_matrix(show_dir, episode_frequency, episode_words):
+    # episode_words maps season -> episode -> words in the episode, stop words included
+    seasons = sorted(episode_frequency)
+    episodes = [[season, sorted(episode_frequency[season])] for season in seasons]
+    terms = {}
+    rows, cols, data = [], [], []
+    totals = []
+    row = 0
+    for season, season_episodes in episodes:
+        for episode in season_episodes:
+            # Episodes analyzed before word totals were recorded fall back to their counted words
+            totals.append(episode_words.get(season, {}).get(episode, sum(episode_frequency[season][episode].values())))
+            for word, freq in episode_frequency[season][episode].items():
+                rows.append(row)
+                cols.append(terms.setdefault(word, len(terms)))
+                data.append(freq)
+            row += 1
+    rows = np.array(rows, dtype=np.int32)
+    cols = np.array(cols, dtype=np.int32)
+    data = np.array(data, dtype=np.int32)
+    order = np.argsort(cols, kind='stable')
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cols, minlength=len(terms)), out=indptr[1:])
+
+    matrix_dir = Path(get_matrix_dir(show_dir))
+    matrix_dir.mkdir(parents=True, exist_ok=True)
+    save_array(matrix_dir / 'indptr.npy', indptr)
+    save_array(matrix_dir / 'indices.npy', rows[order])
+    save_array(matrix_dir / 'data.npy', data[order])
+    # Words per episode, for normalizing counts by episode length
+    save_array(matrix_dir / 'totals.npy', np.array(totals, dtype=np.int64))
+    with open(matrix_dir / 'terms.json', 'w', encoding='utf-8') as f:
+        json.dump(list(terms), f, ensure_ascii=False)
+    with open(matrix_dir / 'episodes.json', 'w', encoding='utf-8') as f:
+        json.dump(episodes, f, ensure_ascii=False)
+
+def load_matrix_frequencies(show_dir):
+    matrix_dir = get_matrix_dir(show_dir)
+    if not os.path.isfile(f'{matrix_dir}/episodes.json'):
+        return {}
+    with open(f'{matrix_dir}/terms.json', 'r', encoding='utf-8') as f:
+        terms = json.load(f)
+    with open(f'{matrix_dir}/episodes.json', 'r', encoding='utf-8') as f:
+        episodes = json.load(f)
+    indptr = np.load(f'{matrix_dir}/indptr.npy')
+    indices = np.load(f'{matrix_dir}/indices.npy')
+    data = np.load(f'{matrix_dir}/data.npy')
+    rows = [Counter() for _ in range(sum(len(season_episodes) for _, season_episodes in episodes))]
+    for column, term in enumerate(terms):
+        for row, freq in zip(indices[indptr[column]:indptr[column + 1]].tolist(), data[indptr[column]:indptr[column + 1]].tolist()):
+            rows[row][term] = freq
+    frequency = {}
+    row = 0
+    for season, season_episodes in episodes:
+        frequency[season] = {}
+        for episode in season_episodes:
+            frequency[season][episode] = rows[row]
+            row += 1
+    return frequency
+
+def load_matrix_totals(show_dir):
+    # Stored words per episode as season -> episode -> words, for re-saving after an incremental update
+    matrix_dir = get_matrix_dir(show_dir)
+    if not os.path.isfile(f'{matrix_dir}/episodes.json') or not os.path.isfile(f'{matrix_dir}/totals.npy'):
+        return {}
+    with open(f'{matrix_dir}/episodes.json', 'r', encoding='utf-8') as f:
+        episodes = json.load(f)
+    totals = iter(np.load(f'{matrix_dir}/totals.npy').tolist())
+    return {season: {episode: next(totals) for episode in season_episodes} for season, season_episodes in episodes}
+
+def load_count_matrix(show):
+    return memory_cache.get(('matrix', show), lambda: read_count_matrix(show))
+
+def read_count_matrix(show):
+    matrix_dir = get_matrix_dir(f'{PARENT_DIR}/{show}')
+    if not os.path.isfile(f'{matrix_dir}/episodes.json'):
+        return None
+    with open(f'{matrix_dir}/terms.json', 'r', encoding='utf-8') as f:
+        terms = {term: index for index, term in enumerate(json.load(f))}
+    with open(f'{matrix_dir}/episodes.json', 'r', encoding='utf-8') as f:
+        episodes = json.load(f)
+    rows = sum(len(season_episodes) for _, season_episodes in episodes)
+    indices = np.load(f'{matrix_dir}/indices.npy', mmap_mode='r')
+    data = np.load(f'{matrix_dir}/data.npy', mmap_mode='r')
+    if os.path.isfile(f'{matrix_dir}/totals.npy'):
+        totals = np.load(f'{matrix_dir}/totals.npy', mmap_mode='r')
+    else:
+        # Matrices saved before word totals were stored only know their counted words
+        totals = np.bincount(indices, weights=data, minlength=rows).astype(np.int64)
+    return {
+        'terms': terms,
+        'episodes': episodes,
+        'rows': rows,
+        'indptr': np.load(f'{matrix_dir}/indptr.npy', mmap_mode='r'),
+        'indices': indices,
+        'data': data,
+        'totals': totals
+    }
+
+def get_season_rows(matrix, seasons):
+    rows = {}
+    row = 0
+    for season, season_episodes in matrix['episodes']:
+        rows[season] = range(row, row + len(season_episodes))
+        row += len(season_episodes)
+    for season in seasons:
+        if season not in rows:
+            raise Exception(f'Season {season} not found in count matrix')
+    return [(season, rows[season]) for season in seasons]
+
+def get_term_counts(matrix, words):
+    counts = np.zeros((len(words), matrix['rows']), dtype=np.int64)
+    for i, word in enumerate(words):
+        column = matrix['terms'].get(word)
+        if column is None:
+            continue
+        start, end = matrix['indptr'][column], matrix['indptr'][column + 1]
+        counts[i, matrix['indices'][start:end]] = matrix['data'][start:end]
+    return counts
+
+### Series: one row per word, one column per episode
+
+SCALES = ('raw', 'per1k')
+
+def scale_counts(counts, totals, scale='raw'):
+    if scale == 'raw':
+        return counts.astype(float)
+    if scale == 'per1k':
+        # Occurrences per 1,000 words of the episode, so long episodes do not dominate
+        return np.divide(counts * 1000., totals, out=np.zeros(counts.shape), where=totals > 0)
+    raise Exception(f'Unknown scale {scale}, expected one of {", ".join(SCALES)}')
+
+def smooth_counts(counts, window=None):
+    # Trailing mean over window episodes; the first window - 1 episodes are left as they are
+    if not window or window <= 1 or counts.shape[-1] < window:
+        return counts
+    cumulative = np.cumsum(counts, axis=-1)
+    smoothed = counts.copy()
+    smoothed[..., window - 1:] = cumulative[..., window - 1:]
+    smoothed[..., window:] -= cumulative[..., :-window]
+    smoothed[..., window - 1:] /= window
+    return smoothed
+
+def get_series(matrix, words, seasons, scale='raw', window=None):
+    # Returns the series for the seasons' episodes and the (1-based) episode each season starts at
+    season_rows = get_season_rows(matrix, seasons)
+    starts = []
+    rows = []
+    for _, season_range in season_rows:
+        starts.append(len(rows) + 1)
+        rows.extend(season_range)
+    rows = np.array(rows, dtype=np.int64)
+    counts = get_term_counts(matrix, words)[:, rows]
+    return smooth_counts(scale_counts(counts, np.asarray(matrix['totals'])[rows], scale), window), starts
@@ -0,0 +1,71 @@
+import numpy as np
+
+from util.archive import read_text
+from util.cache import memory_cache
+from util.constants import PARENT_DIR
+
+### Word frequency and word order tables for a show, season or episode
+
+def get_analysis_path(kind, season=None, episode=None):
+    # Relative to the show directory, as the file may be loose or packed in the show's archive
+    if episode:
+        return f'analysis/{kind}/episode/{season}/{episode}'
+    elif season:
+        return f'analysis/{kind}/season/{season}.txt'
+    return f'analysis/{kind}/show.txt'
+
+def load_frequency(show, season=None, episode=None):
+    return memory_cache.get(('frequency', show, season, episode), lambda: read_frequency(show, season, episode))
+
+def read_frequency(show, season=None, episode=None):
+    frequency = {}
+    for line in read_text(f'{PARENT_DIR}/{show}', get_analysis_path('word_frequency', season, episode)).splitlines():
+        word, freq = line.split(": ")
+        frequency[word] = int(freq)
+    return frequency
+
+def read_order(show, season=None, episode=None):
+    return [word for word in read_text(f'{PARENT_DIR}/{show}', get_analysis_path('word_order', season, episode)).split('\n') if word]
+
+def get_parts(words):
+    return np.array([word.rsplit('_', 1)[-1] for word in words])
+
+def load_frequency_table(show, season=None, episode=None):
+    return memory_cache.get(('frequency_table', show, season, episode), lambda: read_frequency_table(show, season, episode))
+
+def read_frequency_table(show, season=None, episode=None):
+    # Most common first, as stored; parts hold each word's POS tag for filtering
+    frequency = load_frequency(show, season, episode)
+    words = list(frequency)
+    return {'words': words, 'counts': np.fromiter(frequency.values(), dtype=np.int64, count=len(words)), 'parts': get_parts(words)}
+
+def load_order_table(show, season=None, episode=None):
+    return memory_cache.get(('order_table', show, season, episode), lambda: read_order_table(show, season, episode))
+
+def read_order_table(show, season=None, episode=None):
+    words = read_order(show, season, episode)
+    return {'words': words, 'parts': get_parts(words)}
+
+def select_rows(table, parts=None, offset=0, limit=None):
+    # Returns the number of rows matching the POS filter and the requested slice of their indices
+    rows = np.flatnonzero(np.isin(table['parts'], parts)) if parts else np.arange(len(table['words']))
+    end = None if limit is None else offset + limit
+    return len(rows), rows[offset:end]
+
+def get_frequency_page(show, season=None, episode=None, parts=None, offset=0, limit=None, words=None):
+    table = load_frequency_table(show, season, episode)
+    total, rows = select_rows(table, parts, offset, limit)
+    page = {
+        'total': total,
+        'offset': offset,
+        'entries': [[table['words'][row], count] for row, count in zip(rows.tolist(), table['counts'][rows].tolist())]
+    }
+    if words:
+        frequency = load_frequency(show, season, episode)
+        page['words'] = {word: frequency.get(word, 0) for word in words}
+    return page
+
+def get_order_page(show, season=None, episode=None, parts=None, offset=0, limit=None):
+    table = load_order_table(show, season, episode)
+    total, rows = select_rows(table, parts, offset, limit)
+    return {'total': total, 'offset': offset, 'entries': [table['words'][row] for row in rows.tolist()]}
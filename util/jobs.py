@@ -0,0 +1,139 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from util.constants import IMPORT_CONCURRENCY, JOB_HISTORY
+
+### Background jobs for imports, so requests return a job id instead of blocking until the import is done
+
+FINISHED_STATES = {'done', 'failed', 'cancelled'}
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, id, kind, show, name):
+        self.id = id
+        self.kind = kind
+        self.show = show
+        self.name = name
+        self.state = 'queued'
+        self.stages = {}
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self.cancel_requested = threading.Event()
+        # version counts changes so progress streams can wait for the next one
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+
+    def progress(self, stage, done, total):
+        # Passed to the import as its progress callback; raising here is how a running import is cancelled
+        if self.cancel_requested.is_set():
+            raise JobCancelled(f'Import of {self.name} was cancelled')
+        with self.changed:
+            self.stages[stage] = {'done': done, 'total': total}
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait(self, version, timeout=None):
+        # Blocks until the job changes past version (or the timeout passes) and returns the current version
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def is_finished(self):
+        return self.state in FINISHED_STATES
+
+    def as_dict(self):
+        with self.changed:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'show': self.show,
+                'name': self.name,
+                'state': self.state,
+                'stages': {stage: dict(counts) for stage, counts in self.stages.items()},
+                'error': self.error,
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished
+            }
+
+class JobQueue:
+    def __init__(self, concurrency, history):
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='import')
+        self.history = history
+        self.jobs = OrderedDict()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def submit(self, kind, show, name, target, on_done=None):
+        # target(progress) runs the import; on_done(job) runs after it succeeds
+        with self.lock:
+            for job in self.jobs.values():
+                if job.show == show and not job.is_finished():
+                    raise Exception(f'{job.name} is already being imported (job {job.id})')
+            job = Job(str(next(self.ids)), kind, show, name)
+            self.jobs[job.id] = job
+            self.prune()
+            job.future = self.executor.submit(self.run, job, target, on_done)
+        return job
+
+    def run(self, job, target, on_done):
+        if job.cancel_requested.is_set():
+            job.update(state='cancelled', finished=time.time())
+            return
+        job.update(state='running', started=time.time())
+        try:
+            target(job.progress)
+            if on_done:
+                on_done(job)
+        except JobCancelled as e:
+            job.update(state='cancelled', error=str(e), finished=time.time())
+        except Exception as e:
+            print(e)
+            job.update(state='failed', error=str(e), finished=time.time())
+        else:
+            job.update(state='done', finished=time.time())
+
+    def cancel(self, id):
+        job = self.get(id)
+        if job.is_finished():
+            return job
+        job.cancel_requested.set()
+        if job.future.cancel():
+            job.update(state='cancelled', finished=time.time())
+        else:
+            # Running imports stop at their next progress report
+            job.update()
+        return job
+
+    def get(self, id):
+        with self.lock:
+            job = self.jobs.get(id)
+        if job is None:
+            raise Exception(f'Job {id} not found')
+        return job
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def prune(self):
+        finished = [id for id, job in self.jobs.items() if job.is_finished()]
+        for id in finished[:max(len(finished) - self.history, 0)]:
+            del self.jobs[id]
+
+job_queue = JobQueue(IMPORT_CONCURRENCY, JOB_HISTORY)
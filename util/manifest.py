@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+
+from util.cache import memory_cache
+from util.catalog import get_forum
+from util.constants import PARENT_DIR
+from util.version import read_data_version
+
+### One manifest of every imported show, so listing shows does not open three files per show
+# Shows map to their title, episode counts, episode map, page ids and data version.
+
+MANIFEST_LOCK = threading.Lock()
+
+def get_manifest_file():
+    return f'{PARENT_DIR}/manifest.json'
+
+def list_show_dirs():
+    # Only show directories; the manifest itself and any stray files live next to them
+    if not os.path.isdir(PARENT_DIR):
+        return []
+    return sorted(entry.name for entry in os.scandir(PARENT_DIR) if entry.is_dir() and os.path.isfile(f'{entry.path}/meta/map.json'))
+
+def read_show_entry(show):
+    show_dir = f'{PARENT_DIR}/{show}'
+    with open(f'{show_dir}/meta/map.json', 'r', encoding='utf-8') as f:
+        show_map = json.load(f)
+    with open(f'{show_dir}/meta/ids.json', 'r', encoding='utf-8') as f:
+        episode_ids = json.load(f)
+    with open(f'{show_dir}/meta/title.txt', 'r', encoding='utf-8') as f:
+        title = f.read()
+    return {
+        'title': title,
+        'episodes': sum(len(episodes) for episodes in show_map.values()),
+        'seasons': {season: len(episodes) for season, episodes in show_map.items()},
+        'version': read_data_version(show),
+        'map': show_map,
+        'ids': episode_ids
+    }
+
+def write_manifest(manifest):
+    file = get_manifest_file()
+    temp = f'{file}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp, file)
+
+def scan_shows():
+    return {show: read_show_entry(show) for show in list_show_dirs()}
+
+def rebuild_manifest():
+    with MANIFEST_LOCK:
+        manifest = scan_shows()
+        write_manifest(manifest)
+    return manifest
+
+def update_manifest(show):
+    # Called at the end of an import, once the show's meta files and version stamp are written
+    with MANIFEST_LOCK:
+        # Without a manifest yet, every show already on disk goes in along with this one
+        manifest = dict(read_manifest()) if os.path.isfile(get_manifest_file()) else scan_shows()
+        manifest[str(show)] = read_show_entry(show)
+        write_manifest(manifest)
+
+def load_manifest():
+    # Cached against the file's mtime, so an import in another process is picked up, and against the data directory's,
+    # which changes when a show directory is deleted or copied in by hand
+    file = get_manifest_file()
+    if not os.path.isfile(file):
+        return rebuild_manifest()
+    mtime = (os.stat(file).st_mtime_ns, os.stat(PARENT_DIR).st_mtime_ns)
+    return memory_cache.get_fresh(('manifest', None), mtime, read_checked_manifest)
+
+def read_checked_manifest():
+    manifest = read_manifest()
+    if set(manifest) != set(list_show_dirs()):
+        manifest = rebuild_manifest()
+    return manifest
+
+def read_manifest():
+    try:
+        with open(get_manifest_file(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def list_shows():
+    return list(load_manifest())
+
+def get_show_listing():
+    # The aired range comes from the forum catalog, which can be refreshed without reimporting
+    listing = {}
+    for show, entry in load_manifest().items():
+        forum = get_forum(show) or {}
+        listing[show] = {'title': entry['title'], 'episodes': entry['episodes'], 'seasons': entry['seasons'], 'range': forum.get('range')}
+    return listing
+
+def get_show_detail(show):
+    entry = load_manifest().get(str(show))
+    if entry is None:
+        raise Exception(f'Show {show} has not been imported')
+    return entry
+
+SEEN_VERSIONS = None
+
+def sync_shows():
+    # Drops this process's cached data for shows that another process has imported, updated or removed since it last looked
+    global SEEN_VERSIONS
+    versions = {show: entry['version'] for show, entry in load_manifest().items()}
+    with MANIFEST_LOCK:
+        seen, SEEN_VERSIONS = SEEN_VERSIONS, versions
+    if seen is None:
+        return []
+    changed = [show for show in set(seen) | set(versions) if seen.get(show) != versions.get(show)]
+    for show in changed:
+        memory_cache.invalidate_show(show)
+    return changed
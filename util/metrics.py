@@ -0,0 +1,80 @@
+import bisect
+import contextlib
+import threading
+import time
+
+### Timing instrumentation: named spans aggregated into histograms, exported in the Prometheus text format
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def format_labels(labels, **extra):
+    labels = {**dict(labels), **extra}
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self.help = {}
+        self.lock = threading.Lock()
+
+    def observe(self, metric, seconds, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    @contextlib.contextmanager
+    def span(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('oneirocrit_span_seconds', time.perf_counter() - start, span=name, **labels)
+
+    def describe(self, metric, text):
+        self.help[metric] = text
+
+    def render(self, gauges=()):
+        # gauges are extra (name, help, value) samples computed by the caller at scrape time
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            snapshot = [(metric, labels, list(histogram.counts), histogram.sum, histogram.count, histogram.buckets) for (metric, labels), histogram in histograms]
+        described = set()
+        for metric, labels, counts, total, count, buckets in snapshot:
+            if metric not in described:
+                lines.append(f'# HELP {metric} {self.help.get(metric, metric)}')
+                lines.append(f'# TYPE {metric} histogram')
+                described.add(metric)
+            cumulative = 0
+            for bound, bucket in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append(f'{metric}_bucket{format_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{metric}_sum{format_labels(labels)} {total}')
+            lines.append(f'{metric}_count{format_labels(labels)} {count}')
+        for name, text, value in gauges:
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+metrics.describe('oneirocrit_span_seconds', 'Time spent in named phases of imports and requests.')
+metrics.describe('oneirocrit_request_seconds', 'Time spent handling HTTP requests.')
+span = metrics.span
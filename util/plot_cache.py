@@ -0,0 +1,78 @@
+import os
+import threading
+from pathlib import Path
+
+from util.constants import PLOT_CACHE_DIR, PLOT_CACHE_SIZE
+from util.version import make_request_key
+
+### Persistent, content-addressed cache of rendered plots
+# Keys hash the endpoint, the normalized query parameters and the show's data version, so a re-import never serves stale images.
+
+class PlotCache:
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.size = None
+        self.lock = threading.Lock()
+
+    def make_key(self, endpoint, params):
+        return make_request_key(endpoint, params)
+
+    def get_path(self, key):
+        return f'{self.directory}/{key[:2]}/{key}'
+
+    def get(self, key):
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                mimetype = f.readline().decode('utf-8').strip()
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        # The modification time doubles as the last access time for LRU eviction
+        os.utime(path)
+        return mimetype, body
+
+    def put(self, key, mimetype, body):
+        path = Path(self.get_path(key))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(temp, 'wb') as f:
+            f.write(f'{mimetype}\n'.encode('utf-8'))
+            f.write(body)
+        os.replace(temp, path)
+        with self.lock:
+            if self.size is None:
+                self.size = self.scan_size()
+            else:
+                self.size += path.stat().st_size
+            if self.size > self.max_size:
+                self.evict()
+
+    def scan_size(self):
+        return sum(entry.stat().st_size for entry in self.entries())
+
+    def entries(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [entry for folder in os.scandir(self.directory) if folder.is_dir() for entry in os.scandir(folder.path) if entry.is_file() and not entry.name.endswith('.tmp')]
+
+    def evict(self):
+        # Drop least recently used images until the cache is back under 90% of its cap
+        entries = sorted(self.entries(), key=lambda entry: entry.stat().st_mtime)
+        self.size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.size <= self.max_size * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self.size -= size
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        entries = self.entries()
+        return {'entries': len(entries), 'size': sum(entry.stat().st_size for entry in entries), 'max_size': self.max_size}
+
+plot_cache = PlotCache(PLOT_CACHE_DIR, PLOT_CACHE_SIZE)
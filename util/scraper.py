@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+import time
+import httpx
+from pathlib import Path
+
+from util.constants import FOREVER_DREAMING_URL, SCRAPER_CONCURRENCY, SCRAPER_RATE_LIMIT, SCRAPER_RETRIES, SCRAPER_TIMEOUT
+from util.metrics import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class RateLimiter:
+    # Spaces request starts at least 1 / rate seconds apart across every task sharing it
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = 0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class HttpCache:
+    # ETag/Last-Modified validators for files downloaded into a show's raw/ directory
+    def __init__(self, cache_dir):
+        self.path = f'{cache_dir}/cache.json'
+        self.entries = {}
+        if os.path.isfile(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def headers(self, url, file):
+        entry = self.entries.get(url)
+        if not entry or not os.path.isfile(file):
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, response):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self.entries[url] = {'etag': etag, 'last_modified': last_modified}
+        else:
+            self.entries.pop(url, None)
+
+    def save(self):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+
+class Scraper:
+    def __init__(self, cache_dir=None, base_url=FOREVER_DREAMING_URL, concurrency=SCRAPER_CONCURRENCY, rate=SCRAPER_RATE_LIMIT, retries=SCRAPER_RETRIES, timeout=SCRAPER_TIMEOUT, backoff=0.5):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.cache = HttpCache(cache_dir) if cache_dir else None
+        self.limiter = RateLimiter(rate)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.client = None
+
+    async def __aenter__(self):
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self.client = httpx.AsyncClient(limits=limits, timeout=self.timeout, follow_redirects=True, headers={'User-Agent': 'Oneirocrit'})
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        if self.cache:
+            self.cache.save()
+
+    def url(self, path):
+        return f'{self.base_url}/{path}'
+
+    async def fetch(self, path, file=None):
+        # Returns the page text; with a file the body is also written there and reused on 304 Not Modified
+        url = self.url(path)
+        headers = self.cache.headers(url, file) if self.cache and file else {}
+        async with self.semaphore:
+            for attempt in range(self.retries + 1):
+                await self.limiter.wait()
+                start = time.perf_counter()
+                try:
+                    response = await self.client.get(url, headers=headers)
+                except httpx.TransportError as e:
+                    metrics.observe('oneirocrit_span_seconds', time.perf_counter() - start, span='http_fetch', status='error')
+                    error = e
+                    retry_after = None
+                else:
+                    metrics.observe('oneirocrit_span_seconds', time.perf_counter() - start, span='http_fetch', status=response.status_code)
+                    if response.status_code == 304 and headers:
+                        with open(file, 'r', encoding='utf-8') as f:
+                            return f.read()
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        if file:
+                            Path(file).parent.mkdir(parents=True, exist_ok=True)
+                            with open(file, 'w', encoding='utf-8') as f:
+                                f.write(response.text)
+                            if self.cache:
+                                self.cache.store(url, response)
+                        return response.text
+                    error = httpx.HTTPStatusError(f'{response.status_code} for {url}', request=response.request, response=response)
+                    retry_after = response.headers.get('Retry-After')
+                if attempt < self.retries:
+                    delay = self.backoff * 2 ** attempt
+                    if retry_after and retry_after.isdigit():
+                        delay = max(delay, int(retry_after))
+                    await asyncio.sleep(delay)
+            raise error
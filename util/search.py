@@ -0,0 +1,165 @@
+import io
+import json
+import os
+import re
+import threading
+import numpy as np
+from array import array
+from pathlib import Path
+
+from util.archive import folder_exists, list_folder, read_text
+from util.cache import memory_cache
+from util.constants import PARENT_DIR
+from util.counts import save_array
+
+### Positional inverted index over formatted/<season>/<episode>.txt
+# Postings are (episode, token position) pairs grouped by term; line numbers are recovered from per-episode line offsets.
+
+TOKEN_REGEX = re.compile(r"[\w']+")
+QUERY_REGEX = re.compile(r'"([^"]+)"|(\S+)')
+SNIPPET_CONTEXT = 60
+BUILD_LOCK = threading.Lock()
+
+def get_index_dir(show_dir):
+    return f'{show_dir}/analysis/search'
+
+def tokenize(text):
+    return TOKEN_REGEX.findall(text.lower())
+
+def build_search_index(show_dir):
+    # Term ids are collected per episode in compact arrays; docs and positions follow from each episode's length
+    episodes = []
+    terms = {}
+    chunks = []
+    line_offsets, episode_lines = array('I'), [0]
+    for season in list_folder(show_dir, 'formatted'):
+        for episode in list_folder(show_dir, f'formatted/{season}'):
+            episodes.append([season, episode])
+            term_ids = array('I')
+            for line in io.StringIO(read_text(show_dir, f'formatted/{season}/{episode}')):
+                line_offsets.append(len(term_ids))
+                term_ids.extend(terms.setdefault(token, len(terms)) for token in tokenize(line))
+            chunks.append(np.array(term_ids, dtype=np.uint32))
+            episode_lines.append(len(line_offsets))
+
+    lengths = np.array([len(chunk) for chunk in chunks], dtype=np.int64)
+    term_ids = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint32)
+    del chunks
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    order = np.argsort(term_ids, kind='stable')
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=indptr[1:])
+    docs = np.repeat(np.arange(len(episodes), dtype=np.uint32), lengths)
+    positions = (np.arange(len(term_ids), dtype=np.int64) - starts).astype(np.uint32)
+
+    index_dir = Path(get_index_dir(show_dir))
+    index_dir.mkdir(parents=True, exist_ok=True)
+    save_array(index_dir / 'indptr.npy', indptr)
+    save_array(index_dir / 'docs.npy', docs[order])
+    save_array(index_dir / 'positions.npy', positions[order])
+    save_array(index_dir / 'line_offsets.npy', np.array(line_offsets, dtype=np.uint32))
+    save_array(index_dir / 'episode_lines.npy', np.array(episode_lines, dtype=np.int64))
+    # episodes.json goes last, as readers take it to mean the index is complete
+    for name, value in (('terms', list(terms)), ('episodes', episodes)):
+        temp = index_dir / f'{name}.json.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(temp, index_dir / f'{name}.json')
+
+def load_search_index(show):
+    return memory_cache.get(('search', show), lambda: read_search_index(show))
+
+def read_search_index(show):
+    show_dir = f'{PARENT_DIR}/{show}'
+    index_dir = get_index_dir(show_dir)
+    if not os.path.isfile(f'{index_dir}/episodes.json'):
+        # Shows imported before the index existed get one on first search, built once however many searches wait for it
+        if not folder_exists(show_dir, 'formatted'):
+            return None
+        with BUILD_LOCK:
+            if not os.path.isfile(f'{index_dir}/episodes.json'):
+                build_search_index(show_dir)
+    with open(f'{index_dir}/terms.json', 'r', encoding='utf-8') as f:
+        terms = {term: index for index, term in enumerate(json.load(f))}
+    with open(f'{index_dir}/episodes.json', 'r', encoding='utf-8') as f:
+        episodes = json.load(f)
+    arrays = {name: np.load(f'{index_dir}/{name}.npy', mmap_mode='r') for name in ('indptr', 'docs', 'positions', 'line_offsets', 'episode_lines')}
+    return {'terms': terms, 'episodes': episodes, **arrays}
+
+def parse_query(query):
+    clauses = []
+    for phrase, word in QUERY_REGEX.findall(query):
+        tokens = tokenize(phrase or word)
+        if tokens:
+            clauses.append(tokens)
+    return clauses
+
+def get_postings(index, term):
+    column = index['terms'].get(term)
+    if column is None:
+        return np.empty(0, dtype=np.int64)
+    start, end = index['indptr'][column], index['indptr'][column + 1]
+    return (index['docs'][start:end].astype(np.int64) << 32) | index['positions'][start:end]
+
+def match_phrase(index, tokens):
+    # Keys are doc << 32 | position of the phrase's first token
+    matches = get_postings(index, tokens[0])
+    for offset, token in enumerate(tokens[1:], start=1):
+        matches = np.intersect1d(matches, get_postings(index, token) - offset, assume_unique=True)
+        if not len(matches):
+            break
+    return matches
+
+def get_line(index, doc, position):
+    # Returns the line holding a token and the position of that line's first token
+    offsets = index['line_offsets'][index['episode_lines'][doc]:index['episode_lines'][doc + 1]]
+    line = int(np.searchsorted(offsets, position, side='right')) - 1
+    return line, int(offsets[line])
+
+def make_snippet(text, skip, length):
+    spans = [match.span() for match in TOKEN_REGEX.finditer(text.lower())]
+    start, end = spans[skip][0], spans[min(skip + length, len(spans)) - 1][1]
+    return {
+        'left': text[max(0, start - SNIPPET_CONTEXT):start],
+        'match': text[start:end],
+        'right': text[end:end + SNIPPET_CONTEXT]
+    }
+
+def search_show(show, clauses):
+    # Returns sorted match keys and the matched phrase length for each
+    index = load_search_index(show)
+    empty = np.empty(0, dtype=np.int64)
+    if not index:
+        return None, empty, empty
+    matches = [match_phrase(index, tokens) for tokens in clauses]
+    # Every clause has to appear in an episode for it to match
+    docs = None
+    for keys in matches:
+        clause_docs = np.unique(keys >> 32)
+        docs = clause_docs if docs is None else np.intersect1d(docs, clause_docs, assume_unique=True)
+    matches = [keys[np.isin(keys >> 32, docs)] for keys in matches]
+    keys = np.concatenate(matches)
+    lengths = np.concatenate([np.full(len(keys), len(tokens)) for keys, tokens in zip(matches, clauses)])
+    order = np.argsort(keys, kind='stable')
+    return index, keys[order], lengths[order]
+
+def search(query, shows, offset=0, limit=50):
+    clauses = parse_query(query)
+    total = 0
+    episodes = 0
+    page = []
+    for show in shows if clauses else []:
+        index, keys, lengths = search_show(show, clauses)
+        total += len(keys)
+        episodes += len(np.unique(keys >> 32))
+        start = max(offset - (total - len(keys)), 0)
+        end = max(min(offset + limit - (total - len(keys)), len(keys)), start)
+        lines = {}
+        for key, length in zip(keys[start:end].tolist(), lengths[start:end].tolist()):
+            doc, position = key >> 32, key & 0xFFFFFFFF
+            season, episode = index['episodes'][doc]
+            line, line_start = get_line(index, doc, position)
+            if doc not in lines:
+                lines[doc] = read_text(f'{PARENT_DIR}/{show}', f'formatted/{season}/{episode}').split('\n')
+            page.append({'show': show, 'season': season, 'episode': episode, 'line': line, **make_snippet(lines[doc][line], position - line_start, length)})
+    return {'query': query, 'total': total, 'episodes': episodes, 'hits': page}
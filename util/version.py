@@ -0,0 +1,37 @@
+import hashlib
+import json
+import os
+import time
+
+from util.cache import memory_cache
+from util.constants import PARENT_DIR
+
+# A stamp rewritten whenever a show's data changes, so anything derived from it can be keyed on it
+
+def write_data_version(show_dir):
+    with open(f'{show_dir}/meta/version.txt', 'w', encoding='utf-8') as f:
+        f.write(f'{time.time_ns():x}')
+
+def get_data_version(show):
+    return memory_cache.get(('version', show), lambda: read_data_version(show))
+
+def read_data_version(show):
+    show_dir = f'{PARENT_DIR}/{show}'
+    try:
+        with open(f'{show_dir}/meta/version.txt', 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    # Shows imported before version stamps existed
+    try:
+        return f'{os.stat(f"{show_dir}/meta/map.json").st_mtime_ns:x}'
+    except FileNotFoundError:
+        return None
+
+def make_request_key(endpoint, params):
+    # Hashes an endpoint, its non-empty query parameters and the data version of every show they name
+    params = {name: value.strip() for name, value in params.items() if value and value.strip()}
+    shows = params.get('shows', params.get('show', ''))
+    version = [get_data_version(show) for show in shows.split(',') if show] or None
+    payload = json.dumps([endpoint, sorted(params.items()), version])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
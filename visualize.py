@@ -1,90 +1,86 @@
 import base64
 import io
-import os
 import re
-import matplotlib.pyplot as plt
+from matplotlib import colormaps
 from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
 import numpy as np
-from pandas import DataFrame as df
 from wordcloud import WordCloud
 from concurrent.futures import ThreadPoolExecutor
-from functools import lru_cache
 
+from util.archive import list_folder
+from util.cache import memory_cache
 from util.constants import PARENT_DIR
-
-frequency_cache = {}
-
-@lru_cache(maxsize=None)
-def load_frequency(show, season=None, episode=None):
-    frequency = {}
-    if episode:
-        file = f'{PARENT_DIR}/{show}/analysis/word_frequency/episode/{season}/{episode}'
-    elif season:
-        file = f'{PARENT_DIR}/{show}/analysis/word_frequency/season/{season}.txt'
-    else:
-        file = f'{PARENT_DIR}/{show}/analysis/word_frequency/show.txt'
-    with open(file, 'r', encoding='utf-8') as f:
-        for line in f:
-            word, freq = line.split(": ")
-            frequency[word] = int(freq)
-    return frequency
+from util.counts import load_count_matrix, get_season_rows, get_term_counts, get_series, scale_counts, smooth_counts
+from util.frequency import load_frequency
+from util.metrics import span
 
 def get_name_of_show(show):
     with open(f'{PARENT_DIR}/{show}/meta/title.txt', 'r', encoding='utf-8') as f:
         return f.readline().strip()
 
-def frequency_plot(df, starts=None, show=None, season=None, transform=None, color_map='Blues', norm=None, stretch_factor=1.5, plot_type='heatmap'):
-    xy = np.array(df)
+def render_figure(fig, output='base64'):
+    # output is 'base64' (PNG as base64 text, what the frontend expects), 'png' or 'svg'
+    with span('encode', format=output):
+        buf = io.BytesIO()
+        fig.savefig(buf, format='svg' if output == 'svg' else 'png')
+        image = buf.getvalue()
+        return base64.b64encode(image) if output == 'base64' else image
+
+def color_rows(rows, color_map, norm=None):
+    # Every row is scaled on its own unless a shared norm is given, as separate imshow calls would do
+    if norm is None:
+        low = rows.min(axis=1, keepdims=True)
+        value_range = rows.max(axis=1, keepdims=True) - low
+        scaled = np.divide(rows - low, value_range, out=np.zeros(rows.shape), where=value_range > 0)
+    else:
+        scaled = norm(rows)
+    return colormaps[color_map](scaled)
+
+def frequency_plot(x, rows, words, starts=None, show=None, season=None, transform=None, color_map='Blues', norm=None, stretch_factor=1.5, plot_type='heatmap', ylabel='Frequency', output='base64'):
+    # x holds the episode numbers and rows one series per word
+    with span('render', plot=plot_type):
+        fig = draw_frequency_plot(x, rows, words, starts, show, season, color_map, norm, stretch_factor, plot_type, ylabel)
+    return render_figure(fig, output)
+
+def draw_frequency_plot(x, rows, words, starts, show, season, color_map, norm, stretch_factor, plot_type, ylabel):
+    labels = [format_word(word) for word in words]
     if plot_type == 'heatmap' or plot_type == 'sentiment':
-        row_count = xy.shape[1] - 1
-        plt.rcParams["figure.figsize"] = (8, row_count * stretch_factor)
-        height_ratios = [stretch_factor] * row_count
-        fig, axs = plt.subplots(nrows=row_count, sharex=True, gridspec_kw={'height_ratios': height_ratios}, constrained_layout=True)
-        if row_count == 1:
-            axs = [axs]
+        row_count = len(rows)
+        fig = Figure(figsize=(8, row_count * stretch_factor), layout='constrained')
     else:
-        fig, ax = plt.subplots(figsize=(8, 3), constrained_layout=True)
-        axs = [ax]
-
-    x = xy[:, 0]
-    extent = [x[0]-(x[1]-x[0])/2., x[-1]+(x[1]-x[0])/2.,0,1]
-    for ax_i, ax in enumerate(axs):
-        if plot_type == 'heatmap' or plot_type == 'sentiment':
-            i = ax_i + 1
-            y = xy[:, i]
-            ax.imshow(y[np.newaxis,:], cmap=color_map, aspect="auto", extent=extent, norm=norm)
+        fig = Figure(figsize=(8, 3), layout='constrained')
+    ax = fig.add_subplot()
+
+    step = (x[1] - x[0]) / 2. if len(x) > 1 else 0.5
+    if plot_type == 'heatmap' or plot_type == 'sentiment':
+        # All words are drawn as one RGBA image, one row per word, split by white rules
+        extent = [x[0] - step, x[-1] + step, row_count, 0]
+        ax.imshow(color_rows(rows, color_map, norm), aspect='auto', extent=extent, interpolation='nearest')
+        for boundary in range(1, row_count):
+            ax.axhline(boundary, color='white', linewidth=4)
+        if plot_type == 'heatmap':
+            ax.set_yticks(np.arange(row_count) + 0.5)
+            ax.set_yticklabels(labels)
+        else:
             ax.set_yticks([])
-            if plot_type == 'heatmap':
-                ax.set_ylabel(format_word(df.columns[i]))
-            ax.set_xlim(extent[0], extent[1])
-        elif plot_type == 'line':
-            for i in range(1, xy.shape[1]):
-                y = xy[:, i]
-                ax.plot(x, y, label=format_word(df.columns[i]))
-            ax.set_ylabel('Frequency')
-            ax.legend()
-            ax.set_xlim(x[0], x[-1])
-            ax.set_ylim(0, None)
-        if starts:
-            ax.set_xticks(starts)
-            ax.set_xticklabels(generate_season_labels(starts))
-        if ax_i == 0:
-            if plot_type == 'sentiment':
-                ax.set_title('Polarity of words in ' + (get_name_of_show(show) if show else 'show') + (' Season ' + str(int(season)) if season and int(season) > -1 else '') + ' by episode')
-            else:
-                ax.set_title('Frequency of words in ' + (get_name_of_show(show) if show else 'show') + (' Season ' + str(int(season)) if season and int(season) > -1 else '') + ' by episode')
-        if ax_i == len(axs) - 1:
-            ax.set_xlabel('Season' if starts else 'Episode')
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    plt.close(fig)
-    return base64.b64encode(buf.read())
-
-def smooth_ref_count(rc, window=3):
-    rcs = rc.rolling(window).mean().fillna(rc) 
-    rcs['episode'] = rc['episode']
-    return rcs
+        ax.set_xlim(extent[0], extent[1])
+    elif plot_type == 'line':
+        for y, label in zip(rows, labels):
+            ax.plot(x, y, label=label)
+        ax.set_ylabel(ylabel)
+        ax.legend()
+        ax.set_xlim(x[0], x[-1])
+        ax.set_ylim(0, None)
+    if starts:
+        ax.set_xticks(starts)
+        ax.set_xticklabels(generate_season_labels(starts))
+    if plot_type == 'sentiment':
+        ax.set_title('Polarity of words in ' + (get_name_of_show(show) if show else 'show') + (' Season ' + str(int(season)) if season and int(season) > -1 else '') + ' by episode')
+    else:
+        ax.set_title('Frequency of words in ' + (get_name_of_show(show) if show else 'show') + (' Season ' + str(int(season)) if season and int(season) > -1 else '') + ' by episode')
+    ax.set_xlabel('Season' if starts else 'Episode')
+    return fig
 
 def generate_season_labels(starts):
     return [str(i + 1) for i in range(len(starts))]
@@ -98,35 +94,45 @@ def format_word(word):
     except:
         return word
 
+def select_seasons(seasons, season=None, skipOtherSeasons=False):
+    if season:
+        return [season]
+    if skipOtherSeasons:
+        return [season for season in seasons if season.isdigit() and int(season) >= 1]
+    return seasons
+
+def get_ref_count_from_matrix(matrix, words, season=None, skipOtherSeasons=False):
+    ref_count = {}
+    starts = []
+    seasons = select_seasons([season for season, _ in matrix['episodes']], season, skipOtherSeasons)
+    counts = get_term_counts(matrix, words)
+    count = 0
+    for season, rows in get_season_rows(matrix, seasons):
+        starts.append(count + 1)
+        for row in rows:
+            count += 1
+            ref_count[count] = {word: int(counts[i, row]) for i, word in enumerate(words)}
+    return ref_count, starts
+
 def get_ref_count_by_episode(words, show, season=None, skipOtherSeasons=False):
+    matrix = load_count_matrix(show)
+    if matrix:
+        return get_ref_count_from_matrix(matrix, words, season=season, skipOtherSeasons=skipOtherSeasons)
     ref_count = {}
     count = 0
     starts = []
-    if season:
-        seasons = [season]
-    else:
-        seasons = sorted(os.listdir(f'{PARENT_DIR}/{show}/analysis/word_frequency/episode'))
-        if skipOtherSeasons:
-            seasons = [season for season in seasons if season.isdigit() and int(season) >= 1]
+    seasons = select_seasons(list_folder(f'{PARENT_DIR}/{show}', 'analysis/word_frequency/episode'), season, skipOtherSeasons)
 
     def process_episode(season, episode, episode_index):
         episode = episode.split(': ')[0]
-        word_keys = [f'{show}_{season}_{episode}_{word}' for word in words]
-        all_cached = all(word_key in frequency_cache for word_key in word_keys)
-        if all_cached:
-            return episode_index, {word: frequency_cache[word_key] for word, word_key in zip(words, word_keys)}
-        else:
-            frequency = load_frequency(show, season=season, episode=episode)
-            result = {word: frequency.get(word, 0) for word in words}
-            for word, word_key in zip(words, word_keys):
-                frequency_cache[word_key] = frequency.get(word, 0)
-            return episode_index, result
+        frequency = load_frequency(show, season=season, episode=episode)
+        return episode_index, {word: frequency.get(word, 0) for word in words}
 
     with ThreadPoolExecutor() as executor:
         futures = []
         for season in seasons:
             starts.append(count + 1)
-            episodes = sorted(os.listdir(f'{PARENT_DIR}/{show}/analysis/word_frequency/episode/{season}'))
+            episodes = list_folder(f'{PARENT_DIR}/{show}', f'analysis/word_frequency/episode/{season}')
             for episode in episodes:
                 count += 1
                 futures.append(executor.submit(process_episode, season, episode, count))
@@ -136,56 +142,110 @@ def get_ref_count_by_episode(words, show, season=None, skipOtherSeasons=False):
 
     return ref_count, starts
 
-def get_ref_count_by_episode_df(words, show, season=None):
+def get_episode_totals(show, season=None, skipOtherSeasons=False):
+    # Counted words per episode for shows without a count matrix, indexed like get_ref_count_by_episode
+    return memory_cache.get(('totals', show, season, skipOtherSeasons), lambda: read_episode_totals(show, season, skipOtherSeasons))
+
+def read_episode_totals(show, season=None, skipOtherSeasons=False):
+    totals = []
+    for season in select_seasons(list_folder(f'{PARENT_DIR}/{show}', 'analysis/word_frequency/episode'), season, skipOtherSeasons):
+        for episode in list_folder(f'{PARENT_DIR}/{show}', f'analysis/word_frequency/episode/{season}'):
+            totals.append(sum(load_frequency(show, season=season, episode=episode).values()))
+    return np.array(totals, dtype=np.int64)
+
+def get_word_series(words, show, season=None, scale='raw', window=None):
+    # One row per word over every episode of the show (or season), and the episode each season starts at
+    matrix = load_count_matrix(show)
+    if matrix:
+        seasons = select_seasons([season for season, _ in matrix['episodes']], season, skipOtherSeasons=True)
+        return get_series(matrix, words, seasons, scale=scale, window=window)
     ref_count, starts = get_ref_count_by_episode(words, show, season=season, skipOtherSeasons=True)
-    data_frame = df(ref_count).T
-    data_frame.insert(0, 'episode', data_frame.index)
-    data_frame = data_frame.reset_index(drop=True)
-    return data_frame, starts
-
-def generate_heatmap(words, show, season=None, smooth_data=True):
-    ref_count, starts = get_ref_count_by_episode_df(words, show, season)
-    if smooth_data:
-        ref_count = smooth_ref_count(ref_count)
+    counts = np.array([[ref_count[index][word] for index in sorted(ref_count)] for word in words], dtype=np.int64).reshape(len(words), len(ref_count))
+    totals = get_episode_totals(show, season=season, skipOtherSeasons=True)
+    return smooth_counts(scale_counts(counts, totals, scale), window), starts
+
+def get_compare_series(words, show, season=None, scale='raw'):
+    return memory_cache.get(('compare', show, tuple(words), season, scale), lambda: read_compare_series(words, show, season, scale))
+
+def read_compare_series(words, show, season=None, scale='raw'):
+    series, starts = get_word_series(words, show, season=season, scale=scale)
+    return {'title': get_name_of_show(show), 'starts': starts, 'series': dict(zip(words, series))}
+
+def compare_shows(words, shows, season=None, scale='per1k', window=None):
+    with ThreadPoolExecutor() as executor:
+        results = list(executor.map(lambda show: get_compare_series(words, show, season=season, scale=scale), shows))
+    comparison = {}
+    for show, result in zip(shows, results):
+        series = {word: smooth_counts(values, window) for word, values in result['series'].items()}
+        comparison[show] = {**result, 'series': series}
+    return comparison
+
+def get_ylabel(scale):
+    return 'Per 1,000 words' if scale == 'per1k' else 'Frequency'
+
+def generate_compare_plot(words, shows, season=None, scale='per1k', window=None, output='base64'):
+    with span('load_counts', plot='compare'):
+        comparison = compare_shows(words, shows, season=season, scale=scale, window=window)
+    with span('render', plot='compare'):
+        fig = Figure(figsize=(8, 3 + len(words) * len(shows) * 0.15), layout='constrained')
+        ax = fig.add_subplot()
+        for show, result in comparison.items():
+            for word, values in result['series'].items():
+                ax.plot(np.arange(1, len(values) + 1), values, label=f"{format_word(word)} ({result['title']})")
+        ax.set_title('Frequency of words by episode' + (' in Season ' + str(int(season)) if season and season.isdigit() else ''))
+        ax.set_xlabel('Episode')
+        ax.set_ylabel(get_ylabel(scale))
+        ax.set_xlim(1, None)
+        ax.set_ylim(0, None)
+        ax.legend()
+    return render_figure(fig, output)
+
+def generate_heatmap(words, show, season=None, smooth_data=True, scale='raw', window=3, output='base64'):
+    with span('load_counts', plot='heatmap'):
+        series, starts = get_word_series(words, show, season, scale=scale, window=window if smooth_data else None)
     color_map = 'Greens' if season else 'Blues'
     if len(starts) == 1 and season is None:
         season = '-1'
     starts = None if season else starts
-    plot = frequency_plot(ref_count, starts=starts, show=show, season=season, color_map=color_map)
+    plot = frequency_plot(np.arange(1, series.shape[1] + 1), series, words, starts=starts, show=show, season=season, color_map=color_map, output=output)
     return plot
 
-def generate_line_plot(words, show, season=None, smooth_data=True):
-    ref_count, starts = get_ref_count_by_episode_df(words, show, season)
-    if smooth_data:
-        ref_count = smooth_ref_count(ref_count)
+def generate_line_plot(words, show, season=None, smooth_data=True, scale='raw', window=3, output='base64'):
+    with span('load_counts', plot='line'):
+        series, starts = get_word_series(words, show, season, scale=scale, window=window if smooth_data else None)
     if len(starts) == 1 and season is None:
         season = '-1'
     starts = None if season else starts
-    plot = frequency_plot(ref_count, starts=starts, show=show, season=season, plot_type='line')
+    plot = frequency_plot(np.arange(1, series.shape[1] + 1), series, words, starts=starts, show=show, season=season, plot_type='line', ylabel=get_ylabel(scale), output=output)
     return plot
 
-def generate_wordcloud(width, height, show, season=None, episode=None, part=None):
-    frequency = load_frequency(show, season, episode)
+def generate_wordcloud(width, height, show, season=None, episode=None, part=None, output='base64'):
+    with span('load_counts', plot='wordcloud'):
+        frequency = load_frequency(show, season, episode)
     if part:
         frequency = {word: frequency[word] for word in frequency if part in word}
     max_words = 200
     if len(frequency) > max_words:
         frequency = {k: frequency[k] for k in list(frequency.keys())[:max_words]}
-    wordcloud = WordCloud(width=int(width), height=int(height),
-                          colormap='plasma' if episode else 'viridis' if season else 'magma',
-                          background_color='white',
-                          stopwords=None,
-                          min_font_size=10).generate_from_frequencies({format_word(word): frequency[word] for word in frequency})
-    buf = io.BytesIO()
-    wordcloud.to_image().save(buf, format='PNG')
-    buf.seek(0)
-    return base64.b64encode(buf.read())
-
-def generate_sentiment(show, filterSeason=None):
-    sentiment = {}
+    with span('render', plot='wordcloud'):
+        wordcloud = WordCloud(width=int(width), height=int(height),
+                              colormap='plasma' if episode else 'viridis' if season else 'magma',
+                              background_color='white',
+                              stopwords=None,
+                              min_font_size=10).generate_from_frequencies({format_word(word): frequency[word] for word in frequency})
+    with span('encode', format=output):
+        if output == 'svg':
+            return wordcloud.to_svg(embed_font=True).encode('utf-8')
+        buf = io.BytesIO()
+        wordcloud.to_image().save(buf, format='PNG')
+        image = buf.getvalue()
+        return base64.b64encode(image) if output == 'base64' else image
+
+def generate_sentiment(show, filterSeason=None, output='base64'):
+    sentiment = []
     starts = []
     current_season = None
-    with open(f'{PARENT_DIR}/{show}/analysis/sentiment.txt', 'r', encoding='utf-8') as f:
+    with span('load_counts', plot='sentiment'), open(f'{PARENT_DIR}/{show}/analysis/sentiment.txt', 'r', encoding='utf-8') as f:
         index = 0
         for line in f:
             if re.match(r'\d+x\d+\.txt: [\d.-]+ [\d.-]+', line):
@@ -198,12 +258,9 @@ def generate_sentiment(show, filterSeason=None):
                 if season != current_season:
                     starts.append(index)
                     current_season = season
-                sentiment[index] = {'polarity': float(polarity)}
-    data_frame = df(sentiment).T
-    data_frame.insert(0, 'episode', data_frame.index)
-    data_frame = data_frame.reset_index(drop=True)
+                sentiment.append(float(polarity))
     if len(starts) == 1 and filterSeason is None:
         filterSeason = '-1'
     starts = None if filterSeason else starts
-    plot = frequency_plot(data_frame, starts=starts, season=filterSeason, show=show, color_map='RdYlGn', plot_type='sentiment', norm=Normalize(vmin=-0.25, vmax=0.25))
+    plot = frequency_plot(np.arange(1, len(sentiment) + 1), np.array([sentiment]), ['polarity'], starts=starts, season=filterSeason, show=show, color_map='RdYlGn', plot_type='sentiment', norm=Normalize(vmin=-0.25, vmax=0.25), output=output)
     return plot
\ No newline at end of file